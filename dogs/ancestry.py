@@ -0,0 +1,429 @@
+import logging
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Dog, Pedigree, PedigreeClosure
+from .services import bump_version, get_version_key, get_versions, make_dog_key
+
+
+logger = logging.getLogger(__name__)
+
+# Версия всех родословных: увеличивается при массовых изменениях (импорт)
+# Изменение отдельной родословной увеличивает версии предков только затронутых собак (get_ancestry_version_keys)
+PEDIGREE_VERSION_PK = 'all'
+
+# Бэкенды, поддерживающие UNION (с удалением дубликатов) в рекурсивных CTE
+# SQL Server допускает только UNION ALL: на инбредных родословных число строк растет с числом путей,
+# поэтому для него родители загружаются по поколениям (fetch_parents_python)
+CTE_VENDORS = {'sqlite', 'postgresql', 'mysql'}
+
+# Размер пакета для IN (...) и bulk_create: SQL Server допускает не более 2100 параметров в запросе
+CLOSURE_BATCH_SIZE = 1000
+
+
+class PedigreeCycleError(ValueError):
+    """
+    В родословной обнаружен цикл (собака оказалась своим же предком)
+    """
+
+
+def fetch_parents_cte(dog_id, generations):
+    """
+    Загружает родителей собаки на generations поколений вверх одним рекурсивным CTE-запросом
+    UNION убирает повторы предка на одном поколении, поэтому строк не больше, чем (предок, поколение)
+    Возвращает словарь {dog_id: (father_id, mother_id)}
+    """
+    table = Pedigree._meta.db_table
+    sql = (
+        f"WITH RECURSIVE ancestry (dog_id, father_id, mother_id, depth) AS ("
+        f" SELECT p.dog_id, p.father_id, p.mother_id, 0 FROM {table} p WHERE p.dog_id = %s"
+        f" UNION"
+        f" SELECT p.dog_id, p.father_id, p.mother_id, a.depth + 1 FROM {table} p"
+        f" INNER JOIN ancestry a ON p.dog_id = a.father_id OR p.dog_id = a.mother_id"
+        f" WHERE a.depth + 1 < %s"
+        f") SELECT DISTINCT dog_id, father_id, mother_id FROM ancestry"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [dog_id, generations])
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+def fetch_parents_python(dog_id, generations):
+    """
+    Загружает родителей поколение за поколением: один запрос in_bulk на поколение
+    Уже загруженные собаки повторно не запрашиваются
+    """
+    parents = {}
+    frontier = {dog_id}
+    for _ in range(generations):
+        pedigrees = Pedigree.objects.only('dog_id', 'father_id', 'mother_id').in_bulk(frontier, field_name='dog_id')
+        next_frontier = set()
+        for pedigree in pedigrees.values():
+            parents[pedigree.dog_id] = (pedigree.father_id, pedigree.mother_id)
+            next_frontier.update(parent for parent in (pedigree.father_id, pedigree.mother_id) if parent)
+        frontier = next_frontier - set(parents)
+        if not frontier:
+            break
+    return parents
+
+
+def fetch_parents(dog_id, generations):
+    if connection.vendor in CTE_VENDORS:
+        return fetch_parents_cte(dog_id, generations)
+    return fetch_parents_python(dog_id, generations)
+
+
+def get_ancestry_version_keys(dog_id):
+    """
+    Ключи версий предков собаки: общая версия родословных и версия предков этой собаки
+    """
+    return [get_version_key(Pedigree, PEDIGREE_VERSION_PK), get_version_key(PedigreeClosure, dog_id)]
+
+
+def bump_ancestry_versions(dog_ids):
+    """
+    Делает недействительными закэшированных предков собак: их родословные или клички предков изменились
+    """
+    for dog_id in dog_ids:
+        bump_version(PedigreeClosure, dog_id)
+
+
+def get_parents(dog_id, generations=None):
+    """
+    Граф родителей собаки из кэша или базы данных
+    Кэш становится недействительным при изменении родословной собаки или ее предков
+    """
+    generations = generations or settings.PEDIGREE_GENERATIONS
+    versions = '_'.join(str(version) for version in get_versions(get_ancestry_version_keys(dog_id)))
+    cache_key = make_dog_key(f"dog_ancestry_{dog_id}_{generations}_{versions}")
+
+    parents = cache.get(cache_key)
+    if parents is None:
+        parents = fetch_parents(dog_id, generations)
+        cache.set(cache_key, parents, timeout=settings.PEDIGREE_CACHE_TIMEOUT)
+    return parents
+
+
+class AncestryGraph:
+    """
+    Граф предков собаки: построение дерева, поиск циклов, коэффициент инбридинга
+    """
+
+    def __init__(self, dog_id, parents, dogs=None):
+        self.dog_id = dog_id
+        self.parents = parents
+        self.dogs = dogs or {}
+
+    @classmethod
+    def for_dog(cls, dog_id, generations=None, with_dogs=True):
+        """
+        Строит граф для собаки; клички предков загружаются одним запросом in_bulk
+        """
+        parents = get_parents(dog_id, generations)
+        dogs = {}
+        if with_dogs:
+            ids = {dog_id} | set(parents)
+            for father_id, mother_id in parents.values():
+                ids.update(parent for parent in (father_id, mother_id) if parent)
+            dogs = Dog.objects.only('name', 'slug').in_bulk(ids)
+        return cls(dog_id, parents, dogs)
+
+    def get_parents_of(self, dog_id):
+        return self.parents.get(dog_id, (None, None))
+
+    def ancestors(self, dog_id=None):
+        """
+        Все известные предки собаки
+        """
+        result = set()
+        stack = list(self.get_parents_of(dog_id or self.dog_id))
+        while stack:
+            parent = stack.pop()
+            if parent and parent not in result:
+                result.add(parent)
+                stack.extend(self.get_parents_of(parent))
+        return result
+
+    def find_cycle(self):
+        """
+        Возвращает список собак, образующих цикл, или None
+        """
+        visiting, done = set(), set()
+
+        def visit(dog_id, path):
+            visiting.add(dog_id)
+            path.append(dog_id)
+            for parent in self.get_parents_of(dog_id):
+                if not parent or parent in done:
+                    continue
+                if parent in visiting:
+                    return path[path.index(parent):] + [parent]
+                cycle = visit(parent, path)
+                if cycle:
+                    return cycle
+            visiting.discard(dog_id)
+            done.add(dog_id)
+            path.pop()
+            return None
+
+        return visit(self.dog_id, [])
+
+    def tree(self, dog_id=None, depth=None):
+        """
+        Вложенное дерево для шаблона: {'dog': Dog, 'father': {...}, 'mother': {...}}
+        """
+        dog_id = dog_id or self.dog_id
+        depth = settings.PEDIGREE_GENERATIONS if depth is None else depth
+        if not dog_id:
+            return None
+        node = {'id': dog_id, 'dog': self.dogs.get(dog_id), 'father': None, 'mother': None}
+        if depth > 0:
+            father_id, mother_id = self.get_parents_of(dog_id)
+            node['father'] = self.tree(father_id, depth - 1) if father_id else None
+            node['mother'] = self.tree(mother_id, depth - 1) if mother_id else None
+        return node
+
+    def topological_order(self):
+        """
+        Порядок, в котором каждая собака идет раньше своих предков
+        """
+        order = []
+        done = set()
+
+        def visit(dog_id):
+            done.add(dog_id)
+            for parent in self.get_parents_of(dog_id):
+                if parent and parent not in done:
+                    visit(parent)
+            order.append(dog_id)
+
+        visit(self.dog_id)
+        return {dog_id: index for index, dog_id in enumerate(reversed(order))}
+
+    def inbreeding_coefficient(self):
+        """
+        Коэффициент инбридинга по Райту: F(X) = родство(отец, мать)
+        Родство вычисляется рекурсивно, раскрывая ту собаку, которая не может быть предком другой.
+        Предки за пределами загруженных поколений считаются неродственными.
+        """
+        cycle = self.find_cycle()
+        if cycle:
+            raise PedigreeCycleError(f"Цикл в родословной: {cycle}")
+
+        order = self.topological_order()
+        kinship_cache = {}
+
+        def inbreeding(dog):
+            father, mother = self.get_parents_of(dog)
+            return kinship(father, mother)
+
+        def kinship(a, b):
+            if not a or not b:
+                return 0.0
+            if a == b:
+                return 0.5 * (1 + inbreeding(a))
+            key = (a, b) if a < b else (b, a)
+            if key not in kinship_cache:
+                # Раскрываем собаку, которая идет раньше в топологическом порядке (не предок другой)
+                younger, other = (a, b) if order[a] < order[b] else (b, a)
+                father, mother = self.get_parents_of(younger)
+                kinship_cache[key] = 0.5 * (kinship(father, other) + kinship(mother, other))
+            return kinship_cache[key]
+
+        return inbreeding(self.dog_id)
+
+
+def creates_cycle(dog_id, father_id=None, mother_id=None):
+    """
+    Проверяет, станет ли собака своим же предком, если назначить ей указанных родителей
+    Цикл появится, если собака уже предок одного из родителей: одна строка таблицы замыкания
+    по уникальному индексу (предок, потомок), без обхода родословной
+    """
+    if not dog_id:
+        return False
+    if dog_id in (father_id, mother_id):
+        return True
+    parents = [parent for parent in (father_id, mother_id) if parent]
+    return bool(parents) and PedigreeClosure.objects.filter(ancestor_id=dog_id, descendant_id__in=parents).exists()
+
+
+def find_cycles(links):
+    """
+    Собаки, которые станут своими же предками, если назначить им родителей links: {dog_id: (father_id, mother_id)}
+    Предки родителей берутся из таблицы замыкания одним запросом на пакет, связи внутри links проверяются в памяти.
+    Связи только добавляют родителей: прежние предки собак из links не учитываются.
+    """
+    parent_ids = {parent for pair in links.values() for parent in pair if parent}
+    ancestors = defaultdict(set)
+    for batch in batched(parent_ids):
+        for ancestor_id, descendant_id in PedigreeClosure.objects.filter(
+            descendant_id__in=batch
+        ).values_list('ancestor_id', 'descendant_id'):
+            ancestors[descendant_id].add(ancestor_id)
+
+    def reaches_itself(dog_id):
+        seen = set()
+        stack = [dog_id]
+        while stack:
+            current = stack.pop()
+            for ancestor in (*links.get(current, ()), *ancestors.get(current, ())):
+                if ancestor == dog_id:
+                    return True
+                if ancestor and ancestor not in seen:
+                    seen.add(ancestor)
+                    stack.append(ancestor)
+        return False
+
+    return {dog_id for dog_id in links if reaches_itself(dog_id)}
+
+
+def batched(items, size=CLOSURE_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def compute_closure(dog_ids, parents, known=None):
+    """
+    Вычисляет предков каждой собаки из dog_ids с кратчайшей глубиной: {dog_id: {ancestor_id: depth}}
+    parents - {dog_id: (father_id, mother_id)} для собак из dog_ids,
+    known - уже известные предки остальных собак (из таблицы замыкания)
+    """
+    memo = dict(known or {})
+
+    def ancestors_of(dog_id, visiting):
+        if dog_id in memo:
+            return memo[dog_id]
+        result = {}
+        visiting.add(dog_id)
+        for parent in parents.get(dog_id, ()):
+            if not parent or parent in visiting:
+                continue
+            candidates = [(parent, 1)]
+            candidates += [(ancestor, depth + 1) for ancestor, depth in ancestors_of(parent, visiting).items()]
+            for ancestor, depth in candidates:
+                if depth < result.get(ancestor, depth + 1):
+                    result[ancestor] = depth
+        visiting.discard(dog_id)
+        memo[dog_id] = result
+        return result
+
+    return {dog_id: ancestors_of(dog_id, set()) for dog_id in dog_ids}
+
+
+def update_closure(dog_ids):
+    """
+    Пересчитывает таблицу замыкания после изменения родителей собак dog_ids
+    Затрагиваются только строки этих собак и их потомков; предки остальных собак берутся из таблицы.
+    Вызывается в транзакции, изменившей родословные. Родословные затронутых собак блокируются
+    (select_for_update), поэтому параллельные изменения общих потомков пересчитываются по очереди.
+    Возвращает id затронутых собак (dog_ids и их потомки)
+    """
+    dog_ids = {dog_id for dog_id in dog_ids if dog_id}
+    if not dog_ids:
+        return set()
+    with transaction.atomic():
+        affected = set(dog_ids)
+        parents = {}
+        while True:
+            # Потомки перечитываются после блокировки: параллельная транзакция могла добавить новых
+            for batch in batched(dog_ids):
+                affected.update(
+                    PedigreeClosure.objects.filter(ancestor_id__in=batch).values_list('descendant_id', flat=True)
+                )
+            to_lock = affected - set(parents)
+            if not to_lock:
+                break
+            for dog_id in to_lock:
+                parents[dog_id] = (None, None)
+            for batch in batched(sorted(to_lock)):
+                for dog_id, father_id, mother_id in Pedigree.objects.select_for_update().filter(
+                    dog_id__in=batch
+                ).order_by('dog_id').values_list('dog_id', 'father_id', 'mother_id'):
+                    parents[dog_id] = (father_id, mother_id)
+
+        outside = {parent for pair in parents.values() for parent in pair if parent and parent not in affected}
+        known = {dog_id: {} for dog_id in outside}
+        for batch in batched(outside):
+            for ancestor_id, descendant_id, depth in PedigreeClosure.objects.filter(
+                descendant_id__in=batch
+            ).values_list('ancestor_id', 'descendant_id', 'depth'):
+                known[descendant_id][ancestor_id] = depth
+
+        for batch in batched(affected):
+            PedigreeClosure.objects.filter(descendant_id__in=batch).delete()
+        closure = compute_closure(affected, parents, known)
+        PedigreeClosure.objects.bulk_create(
+            (
+                PedigreeClosure(ancestor_id=ancestor_id, descendant_id=dog_id, depth=depth)
+                for dog_id, ancestors in closure.items()
+                for ancestor_id, depth in ancestors.items()
+            ),
+            batch_size=CLOSURE_BATCH_SIZE,
+        )
+    return affected
+
+
+def rebuild_closure():
+    """
+    Полностью перестраивает таблицу замыкания по всем родословным
+    Возвращает количество созданных строк
+    """
+    parents = {
+        dog_id: (father_id, mother_id)
+        for dog_id, father_id, mother_id in Pedigree.objects.values_list('dog_id', 'father_id', 'mother_id').iterator()
+    }
+    closure = compute_closure(parents, parents)
+    rows = [
+        PedigreeClosure(ancestor_id=ancestor_id, descendant_id=dog_id, depth=depth)
+        for dog_id, ancestors in closure.items()
+        for ancestor_id, depth in ancestors.items()
+    ]
+    with transaction.atomic():
+        PedigreeClosure.objects.all().delete()
+        PedigreeClosure.objects.bulk_create(rows, batch_size=CLOSURE_BATCH_SIZE)
+    return len(rows)
+
+
+def get_descendants(dog_id, max_depth=None):
+    """
+    Все потомки собаки одним запросом по таблице замыкания
+    """
+    queryset = Dog.objects.filter(ancestor_links__ancestor_id=dog_id)
+    if max_depth:
+        queryset = queryset.filter(ancestor_links__depth__lte=max_depth)
+    return queryset
+
+
+def get_ancestors(dog_id, max_depth=None):
+    """
+    Все предки собаки одним запросом по таблице замыкания
+    """
+    queryset = Dog.objects.filter(descendant_links__descendant_id=dog_id)
+    if max_depth:
+        queryset = queryset.filter(descendant_links__depth__lte=max_depth)
+    return queryset
+
+
+def get_common_ancestors(dog_id, other_id):
+    """
+    Общие предки двух собак (например, для оценки родства при подборе пары)
+    """
+    return Dog.objects.filter(descendant_links__descendant_id=dog_id).filter(
+        descendant_links__descendant_id=other_id
+    )
+
+
+def get_descendant_ids(dog_id):
+    return set(PedigreeClosure.objects.filter(ancestor_id=dog_id).values_list('descendant_id', flat=True))
+
+
+def get_children_ids(dog_id):
+    """
+    Собаки, у которых dog_id записан отцом или матерью
+    """
+    return set(
+        Pedigree.objects.filter(Q(father_id=dog_id) | Q(mother_id=dog_id)).values_list('dog_id', flat=True)
+    )
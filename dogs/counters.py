@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .models import Dog
+from .services import bump_version
+from .utils import send_email
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ Redis-хэша с накопленными просмотрами: {dog_id: прирост}
+VIEWS_BUFFER_KEY = 'dogs:views_buffer'
+
+# Порог, при достижении кратного значения которого владелец получает письмо
+VIEWS_MILESTONE = 100
+
+# Локальный буфер на случай недоступности Redis
+_local_buffer = Counter()
+_local_lock = threading.Lock()
+_last_local_flush = time.monotonic()
+
+
+def get_redis_connection():
+    """
+    Возвращает соединение с Redis из кэша по умолчанию
+    Если кэш не использует django_redis, возвращает None
+    """
+    try:
+        from django_redis import get_redis_connection as _get_connection
+        return _get_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def increment_dog_views(dog_id):
+    """
+    Атомарно увеличивает счетчик просмотров собаки в буфере
+    Возвращает количество просмотров, еще не записанных в базу данных
+    """
+    connection = get_redis_connection()
+    if connection is not None:
+        try:
+            return connection.hincrby(VIEWS_BUFFER_KEY, dog_id, 1)
+        except Exception as exc:
+            logger.warning(f"Redis недоступен, просмотры собаки {dog_id} буферизуются локально: {exc}")
+
+    with _local_lock:
+        _local_buffer[dog_id] += 1
+        pending = _local_buffer[dog_id]
+        flush_due = time.monotonic() - _last_local_flush >= settings.DOG_VIEWS_FLUSH_INTERVAL
+
+    if flush_due:
+        flush_views()
+    return pending
+
+
+def _drain_redis_buffer():
+    """
+    Забирает накопленные просмотры из Redis
+    Хэш переименовывается под уникальным именем, чтобы новые просмотры не потерялись во время сброса.
+    Возвращает просмотры и имя переименованного хэша: он удаляется только после записи в базу данных.
+    """
+    connection = get_redis_connection()
+    if connection is None:
+        return Counter(), None
+
+    processing_key = f"{VIEWS_BUFFER_KEY}:flushing:{uuid.uuid4().hex}"
+    try:
+        if not connection.exists(VIEWS_BUFFER_KEY):
+            return Counter(), None
+        connection.rename(VIEWS_BUFFER_KEY, processing_key)
+        data = connection.hgetall(processing_key)
+    except Exception as exc:
+        logger.warning(f"Не удалось получить буфер просмотров из Redis: {exc}")
+        return Counter(), None
+
+    return Counter({int(dog_id): int(count) for dog_id, count in data.items()}), processing_key
+
+
+def _release_redis_buffer(processing_key):
+    """
+    Удаляет переименованный хэш после записи просмотров в базу данных
+    """
+    if processing_key is None:
+        return
+    try:
+        get_redis_connection().delete(processing_key)
+    except Exception as exc:
+        logger.warning(f"Не удалось удалить записанный буфер просмотров {processing_key}: {exc}")
+
+
+def _restore_redis_buffer(processing_key, counts):
+    """
+    Возвращает просмотры в буфер Redis, если запись в базу данных не удалась
+    """
+    if processing_key is None:
+        return
+    connection = get_redis_connection()
+    try:
+        pipeline = connection.pipeline()
+        for dog_id, count in counts.items():
+            pipeline.hincrby(VIEWS_BUFFER_KEY, dog_id, count)
+        pipeline.delete(processing_key)
+        pipeline.execute()
+    except Exception as exc:
+        # Хэш processing_key остается в Redis, просмотры можно восстановить вручную
+        logger.error(f"Не удалось вернуть просмотры в буфер, они сохранены в {processing_key}: {exc}")
+
+
+def _drain_local_buffer():
+    """
+    Забирает накопленные просмотры из локального буфера процесса
+    """
+    global _last_local_flush
+    with _local_lock:
+        counts = Counter(_local_buffer)
+        _local_buffer.clear()
+        _last_local_flush = time.monotonic()
+    return counts
+
+
+def _restore_local_buffer(counts):
+    with _local_lock:
+        _local_buffer.update(counts)
+
+
+def flush_views():
+    """
+    Записывает накопленные просмотры в базу данных
+    Собаки с одинаковым приростом обновляются одним запросом
+    UPDATE ... SET views_count = views_count + n
+    Если запись не удалась, просмотры возвращаются в буферы и будут записаны при следующем сбросе.
+    Возвращает словарь {dog_id: прирост}
+    """
+    redis_counts, processing_key = _drain_redis_buffer()
+    local_counts = _drain_local_buffer()
+    counts = redis_counts + local_counts
+    if not counts:
+        _release_redis_buffer(processing_key)
+        return counts
+
+    dog_ids_by_delta = defaultdict(list)
+    for dog_id, delta in counts.items():
+        dog_ids_by_delta[delta].append(dog_id)
+
+    try:
+        with transaction.atomic():
+            for delta, dog_ids in dog_ids_by_delta.items():
+                Dog.objects.filter(pk__in=dog_ids).update(views_count=F('views_count') + delta)
+    except Exception:
+        _restore_redis_buffer(processing_key, redis_counts)
+        _restore_local_buffer(local_counts)
+        raise
+    _release_redis_buffer(processing_key)
+
+    for dog_id in counts:
+        bump_version(Dog, dog_id)
+    logger.info(f"Записаны просмотры для {len(counts)} собак.")
+
+    dogs = Dog.objects.filter(pk__in=counts.keys()).select_related('owner')
+    for dog in dogs:
+        previous = dog.views_count - counts[dog.pk]
+        if dog.views_count // VIEWS_MILESTONE > previous // VIEWS_MILESTONE:
+            notify_views_milestone(dog, dog.views_count // VIEWS_MILESTONE * VIEWS_MILESTONE)
+
+    return counts
+
+
+def notify_views_milestone(dog, milestone):
+    """
+    Отправляет письмо владельцу, если количество просмотров собаки достигло кратного 100 значения
+    """
+    if not dog.owner or not dog.owner.email:
+        return
+
+    subject = f"Ваша собака {dog.name} популярна!"
+    message = f"Карточка вашей собаки '{dog.name}' набрала {milestone} просмотров."
+    send_email(subject, message, [dog.owner.email])
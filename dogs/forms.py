@@ -1,5 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from users.uploads import NormalizedImageField
 from .models import Dog, Pedigree
 from datetime import date
 
@@ -12,6 +13,7 @@ class DogForm(forms.ModelForm):
     class Meta:
         model = Dog
         fields = ['name', 'breed', 'birth_date', 'photo']
+        field_classes = {'photo': NormalizedImageField}
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'breed': forms.Select(attrs={'class': 'form-control'}),
@@ -0,0 +1,122 @@
+import hashlib
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from users.authorization import get_access
+from .services import aget_generation, aget_versions, get_versions, make_dog_key
+
+# Группы пользователей, для которых фрагменты берутся из кэша
+CACHED_BUCKETS = ('anonymous', 'user')
+
+
+def get_role_bucket(user, owner_id=None):
+    """
+    Группа пользователя, от которой зависит вывод страницы: anonymous, user, owner или staff
+    """
+    if not user.is_authenticated:
+        return 'anonymous'
+    # Администраторы, модераторы и суперпользователи видят служебные кнопки: страницы для них не кэшируются
+    if get_access(user).is_moderator or user.is_superuser:
+        return 'staff'
+    if owner_id is not None and user.pk == owner_id:
+        return 'owner'
+    return 'user'
+
+
+def normalize_params(query, names, defaults=None):
+    """
+    Строка только из значимых параметров запроса в постоянном порядке, без пустых значений и значений по умолчанию
+    """
+    defaults = defaults or {}
+    items = sorted(
+        (name, value.strip()) for name in names for value in query.getlist(name)
+        if value.strip() and value.strip() != defaults.get(name)
+    )
+    return urlencode(items)
+
+
+class FragmentCache:
+    """
+    Фрагменты одной страницы в кэше, загружаемые одним запросом get_many (load или aload)
+    """
+
+    def __init__(self, key_prefix, names, timeout):
+        self.timeout = timeout
+        self.keys = {name: f"{key_prefix}_{name}" for name in names}
+        self.fragments = {}
+
+    def set_loaded(self, cached):
+        self.fragments = {name: cached[key] for name, key in self.keys.items() if key in cached}
+        return self
+
+    def load(self):
+        return self.set_loaded(cache.get_many(list(self.keys.values())))
+
+    async def aload(self):
+        return self.set_loaded(await cache.aget_many(list(self.keys.values())))
+
+    def is_complete(self):
+        return len(self.fragments) == len(self.keys)
+
+    def get(self, name):
+        return self.fragments.get(name)
+
+    def set(self, name, html):
+        self.fragments[name] = html
+        cache.set(self.keys[name], html, timeout=self.timeout)
+
+
+class FragmentCacheMixin:
+    """
+    Кэширование фрагментов шаблона ({% fragment_cache 'имя' %}) по ключу
+    (представление, параметры запроса, группа пользователя, версии объектов)
+    Для групп вне CACHED_BUCKETS фрагменты всегда отображаются заново.
+    """
+    fragment_view_name = None
+    fragment_names = ('content',)
+    fragment_params = ()
+    fragment_param_defaults = {}
+    fragment_cache = None
+
+    def get_fragment_bucket(self):
+        return get_role_bucket(self.request.user)
+
+    def get_fragment_version_keys(self):
+        """
+        Ключи версий объектов, при изменении которых фрагменты становятся недействительными
+        """
+        return []
+
+    def make_fragment_cache(self, bucket, versions, generation=None):
+        params = normalize_params(self.request.GET, self.fragment_params, self.fragment_param_defaults)
+        digest = hashlib.md5(f"{params}|{versions}".encode('utf-8')).hexdigest()
+        key_prefix = make_dog_key(f"fragment_{self.fragment_view_name}_{bucket}_{digest}", generation)
+        return FragmentCache(key_prefix, self.fragment_names, settings.DOG_FRAGMENT_CACHE_TIMEOUT)
+
+    def get_fragment_cache(self):
+        bucket = self.get_fragment_bucket()
+        if bucket not in CACHED_BUCKETS:
+            return None
+        return self.make_fragment_cache(bucket, get_versions(self.get_fragment_version_keys())).load()
+
+    async def aget_fragment_bucket(self):
+        return self.get_fragment_bucket()
+
+    async def aget_fragment_cache(self):
+        """
+        Асинхронная версия get_fragment_cache: версии и фрагменты читаются асинхронными методами кэша
+        """
+        bucket = await self.aget_fragment_bucket()
+        if bucket not in CACHED_BUCKETS:
+            return None
+        versions = await aget_versions(self.get_fragment_version_keys())
+        fragment_cache = self.make_fragment_cache(bucket, versions, await aget_generation())
+        return await fragment_cache.aload()
+
+    def has_cached_fragments(self):
+        return self.fragment_cache is not None and self.fragment_cache.is_complete()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fragment_cache'] = self.fragment_cache
+        return context
@@ -0,0 +1,172 @@
+import itertools
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, NotSupportedError
+from dogs.models import Breed, Dog
+from dogs.pagination import KeysetPaginator
+from users.slugs import fill_slugs
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark_owner'
+BENCHMARK_BREED_PREFIX = 'Benchmark '
+
+SEARCHES = ['', 'ar']
+BREED_SEARCHES = ['', 'Benchmark 1']
+SORT_FIELDS = ['name', 'breed_id', 'birth_date']
+STATUSES = [True, False]
+
+
+class Command(BaseCommand):
+    help = 'Seed dogs and time the dog list filter/sort queries with and without indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Number of dogs to create before benchmarking')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query, the median is reported')
+        parser.add_argument('--page-size', type=int, default=20, help='Page size for list queries')
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Also run with the Dog/Breed Meta.indexes dropped and report before/after'
+        )
+        parser.add_argument('--explain', action='store_true', help='Print the query plan when supported')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded benchmark data and exit')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['cleanup']:
+            self.cleanup()
+            return
+
+        if kwargs['seed']:
+            self.seed(kwargs['seed'])
+
+        self.stdout.write(f"Dogs in table: {Dog.objects.count()}")
+
+        if kwargs['compare']:
+            self.drop_indexes()
+            try:
+                before = self.run_benchmark(kwargs)
+            finally:
+                self.create_indexes()
+            after = self.run_benchmark(kwargs)
+            self.report(before, after)
+        else:
+            self.report(self.run_benchmark(kwargs))
+
+    def seed(self, count):
+        """
+        Создает тестовых собак пакетами через bulk_create
+        """
+        owner, _ = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'email': f'{BENCHMARK_USERNAME}@example.com'}
+        )
+        breeds = [
+            Breed.objects.get_or_create(name=f'{BENCHMARK_BREED_PREFIX}{i}')[0] for i in range(50)
+        ]
+        syllables = ['bar', 'rex', 'lu', 'ma', 'to', 'ar', 'ki', 'no', 'sha', 'dor']
+        started = time.perf_counter()
+
+        for start in range(0, count, 1000):
+            dogs = [
+                Dog(
+                    name=''.join(random.choices(syllables, k=3)).capitalize(),
+                    breed=random.choice(breeds),
+                    owner=owner,
+                    birth_date=date(2010, 1, 1) + timedelta(days=random.randint(0, 5000)),
+                    is_active=random.random() > 0.1,
+                )
+                for _ in range(start, min(start + 1000, count))
+            ]
+            Dog.objects.bulk_create(fill_slugs(dogs))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {count} dogs in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def cleanup(self):
+        deleted, _ = Dog.objects.filter(owner__username=BENCHMARK_USERNAME).delete()
+        Breed.objects.filter(name__startswith=BENCHMARK_BREED_PREFIX).delete()
+        User.objects.filter(username=BENCHMARK_USERNAME).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} benchmark rows"))
+
+    def drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in (Dog, Breed):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model in (Dog, Breed):
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+    def build_queryset(self, is_active, search, breed_search):
+        """
+        Повторяет фильтрацию DogListView.get_queryset
+        """
+        queryset = Dog.objects.filter(is_active=is_active)
+        if search:
+            queryset = queryset.filter(name__icontains=search)
+        if breed_search:
+            queryset = queryset.filter(breed__name__icontains=breed_search)
+        return queryset.select_related('owner', 'breed')
+
+    def time_call(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def run_benchmark(self, options):
+        """
+        Замеряет первую страницу, глубокую страницу (по курсору) и COUNT(*) для каждой комбинации
+        """
+        results = {}
+        for is_active, search, breed_search, sort_field in itertools.product(
+            STATUSES, SEARCHES, BREED_SEARCHES, SORT_FIELDS
+        ):
+            queryset = self.build_queryset(is_active, search, breed_search)
+            paginator = KeysetPaginator(queryset, sort_field, options['page_size'])
+            first_page = self.time_call(lambda: paginator.page(), options['repeat'])
+
+            deep_cursor = None
+            middle = queryset.order_by(sort_field, 'pk')[queryset.count() // 2:][:1]
+            if middle:
+                deep_cursor = paginator.encode_cursor(middle[0], 'next')
+            deep_page = self.time_call(lambda: paginator.page(deep_cursor), options['repeat'])
+            count = self.time_call(queryset.count, options['repeat'])
+
+            key = (
+                'active' if is_active else 'inactive',
+                search or '-',
+                breed_search or '-',
+                sort_field,
+            )
+            results[key] = (first_page, deep_page, count)
+
+            if options['explain']:
+                try:
+                    self.stdout.write(queryset.order_by(sort_field, 'pk')[:options['page_size']].explain())
+                except NotSupportedError:
+                    self.stdout.write(self.style.WARNING(
+                        f"EXPLAIN is not supported by the {connection.vendor} backend"
+                    ))
+                    options['explain'] = False
+        return results
+
+    def report(self, results, after=None):
+        header = f"{'status':<9}{'search':<8}{'breed':<13}{'sort':<12}{'first ms':>10}{'deep ms':>10}{'count ms':>10}"
+        if after:
+            header += f"{'first after':>13}{'deep after':>12}{'count after':>13}"
+        self.stdout.write(header)
+        for key, (first_page, deep_page, count) in results.items():
+            line = f"{key[0]:<9}{key[1]:<8}{key[2]:<13}{key[3]:<12}{first_page:>10.2f}{deep_page:>10.2f}{count:>10.2f}"
+            if after:
+                line += f"{after[key][0]:>13.2f}{after[key][1]:>12.2f}{after[key][2]:>13.2f}"
+            self.stdout.write(line)
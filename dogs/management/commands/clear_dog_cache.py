@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from dogs.services import clear_dogs_cache, filter_dogs
+
+
+class Command(BaseCommand):
+    help = 'Invalidate cached dogs by id list, owner or breed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, nargs='+', help='Dog ids')
+        parser.add_argument('--owner', type=int, help='Owner user id')
+        parser.add_argument('--breed', type=int, help='Breed id')
+        parser.add_argument('--batch-size', type=int, default=500, help='Dogs per delete_many call')
+
+    def handle(self, *args, **kwargs):
+        if not kwargs['ids'] and not kwargs['owner'] and not kwargs['breed']:
+            raise CommandError('Specify --ids, --owner or --breed')
+
+        queryset = filter_dogs(kwargs['ids'], kwargs['owner'], kwargs['breed'])
+        count = clear_dogs_cache(queryset, batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Invalidated cache for {count} dogs'))
@@ -0,0 +1,27 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from dogs.counters import flush_views
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered dog views to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true', help='Keep flushing on a schedule until interrupted'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.DOG_VIEWS_FLUSH_INTERVAL,
+            help='Seconds between flushes in --loop mode'
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            counts = flush_views()
+            self.stdout.write(self.style.SUCCESS(
+                f'Flushed {sum(counts.values())} views for {len(counts)} dogs'
+            ))
+            if not kwargs['loop']:
+                break
+            time.sleep(kwargs['interval'])
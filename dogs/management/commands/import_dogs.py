@@ -0,0 +1,306 @@
+import csv
+import itertools
+import json
+import time
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from dogs.ancestry import CLOSURE_BATCH_SIZE, PEDIGREE_VERSION_PK, find_cycles, update_closure
+from dogs.models import CYCLE_ERROR, Breed, Dog, Pedigree
+from dogs.search import get_search_backend
+from dogs.services import DOG_LIST_VERSION_PK, bump_version
+from users.slugs import fill_slugs
+
+User = get_user_model()
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+
+
+def read_rows(path, file_format):
+    """
+    Построчно читает CSV или JSONL, не загружая файл в память целиком
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def get_value(row, key, default=''):
+    """
+    Значение поля строки в виде строки без пробелов по краям
+    В JSONL значения могут быть null или числами: null считается отсутствующим значением
+    """
+    value = row.get(key)
+    return default if value is None else str(value).strip()
+
+
+def chunked(rows, size):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import dogs and pedigrees from CSV or JSONL. '
+        'Columns: name, breed, owner (username), birth_date, description, is_active, '
+        'registration_number, issued_by, issue_date, father, mother '
+        '(father/mother are registration numbers of already imported or same-file pedigrees; '
+        'parents from later rows are linked after all dogs are imported)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Path to the .csv or .jsonl file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (detected from extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk_create and transaction')
+        parser.add_argument('--create-breeds', action='store_true', help='Create breeds that do not exist')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate rows, write nothing')
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        file_format = kwargs['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        self.dry_run = kwargs['dry_run']
+        self.create_breeds = kwargs['create_breeds']
+
+        # Кэши поиска, общие для всех пакетов: заполняются одним запросом на пакет
+        self.breeds = {}
+        self.owners = {}
+        self.registrations = {}
+        self.seen_numbers = set()
+        # Родословные, родители которых встречаются в следующих пакетах: {номер: (отец, мать)}
+        self.pending_parents = {}
+
+        totals = {'rows': 0, 'dogs': 0, 'pedigrees': 0, 'errors': 0}
+        started = time.perf_counter()
+
+        try:
+            for number, chunk in enumerate(chunked(read_rows(path, file_format), kwargs['chunk_size']), start=1):
+                chunk_started = time.perf_counter()
+                dogs, pedigrees, errors = self.import_chunk(chunk, offset=totals['rows'])
+                totals['rows'] += len(chunk)
+                totals['dogs'] += dogs
+                totals['pedigrees'] += pedigrees
+                totals['errors'] += errors
+                elapsed = time.perf_counter() - chunk_started
+                self.stdout.write(
+                    f"Chunk {number}: {dogs} dogs, {pedigrees} pedigrees, {errors} errors "
+                    f"({len(chunk) / elapsed:.0f} rows/s)"
+                )
+        except (OSError, csv.Error, json.JSONDecodeError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        linked, errors = self.link_pending_parents()
+        totals['errors'] += errors
+        if self.pending_parents:
+            self.stdout.write(f"Linked parents from later rows: {linked} pedigrees, {errors} errors")
+
+        elapsed = time.perf_counter() - started
+        verb = 'Validated' if self.dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['dogs']} dogs and {totals['pedigrees']} pedigrees from {totals['rows']} rows "
+            f"in {elapsed:.1f}s ({totals['rows'] / elapsed if elapsed else 0:.0f} rows/s), "
+            f"{totals['errors']} rows with errors"
+        ))
+
+    def resolve_lookups(self, chunk):
+        """
+        Загружает недостающие породы, владельцев и регистрационные номера одним запросом каждого вида
+        """
+        breed_names = {get_value(row, 'breed') for row in chunk} - set(self.breeds) - {''}
+        if breed_names:
+            for breed in Breed.objects.filter(name__in=breed_names):
+                self.breeds[breed.name] = breed.pk
+            missing = breed_names - set(self.breeds)
+            if missing and self.create_breeds and not self.dry_run:
+                for name in missing:
+                    self.breeds[name] = Breed.objects.create(name=name).pk
+
+        usernames = {get_value(row, 'owner') for row in chunk} - set(self.owners) - {''}
+        if usernames:
+            self.owners.update(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+        # Номера родителей и собственные номера пакета (для проверки уникальности)
+        numbers = set()
+        for row in chunk:
+            numbers.update({
+                get_value(row, 'father'),
+                get_value(row, 'mother'),
+                get_value(row, 'registration_number'),
+            })
+        numbers -= set(self.registrations) | {''}
+        if numbers:
+            self.registrations.update(
+                Pedigree.objects.filter(registration_number__in=numbers).values_list('registration_number', 'dog_id')
+            )
+
+    def build_dog(self, row):
+        """
+        Создает несохраненный объект Dog и проверяет его правилами модели
+        """
+        breed_name = get_value(row, 'breed')
+        if breed_name not in self.breeds and not (self.create_breeds and self.dry_run):
+            raise ValidationError(f"Неизвестная порода: {breed_name!r}")
+        owner = get_value(row, 'owner')
+        if owner not in self.owners:
+            raise ValidationError(f"Неизвестный владелец: {owner!r}")
+        birth_date = get_value(row, 'birth_date')
+
+        dog = Dog(
+            name=get_value(row, 'name'),
+            breed_id=self.breeds.get(breed_name),
+            owner_id=self.owners[owner],
+            birth_date=date.fromisoformat(birth_date) if birth_date else None,
+            description=get_value(row, 'description') or None,
+            is_active=get_value(row, 'is_active', 'true').lower() in TRUE_VALUES,
+        )
+        dog.clean_fields(exclude=['slug', 'breed', 'owner', 'photo'])
+        dog.clean()
+        return dog
+
+    def build_pedigree(self, row, dog):
+        """
+        Создает несохраненный объект Pedigree и проверяет его правилами модели
+        Родители сравниваются по регистрационным номерам: собаки еще не сохранены.
+        Циклы проверяются после вставки собак (find_cycles), родители из следующих пакетов - после всего импорта.
+        """
+        number = get_value(row, 'registration_number')
+        if not number:
+            return None
+
+        issue_date = get_value(row, 'issue_date')
+        pedigree = Pedigree(
+            dog=dog,
+            registration_number=number,
+            issued_by=get_value(row, 'issued_by'),
+            issue_date=date.fromisoformat(issue_date) if issue_date else None,
+        )
+        pedigree.clean_fields(exclude=['dog', 'father', 'mother'])
+        father, mother = get_value(row, 'father'), get_value(row, 'mother')
+        Pedigree.check_parents(number, father, mother)
+        return pedigree, father, mother
+
+    def import_chunk(self, chunk, offset):
+        self.resolve_lookups(chunk)
+
+        rows = []
+        errors = 0
+        for line, row in enumerate(chunk, start=offset + 1):
+            try:
+                dog = self.build_dog(row)
+                pedigree = self.build_pedigree(row, dog)
+                if pedigree:
+                    number = pedigree[0].registration_number
+                    if number in self.registrations or number in self.seen_numbers:
+                        raise ValidationError(f"Регистрационный номер {number} уже существует.")
+                    self.seen_numbers.add(number)
+                rows.append((dog, pedigree))
+            except (ValidationError, ValueError, KeyError) as exc:
+                errors += 1
+                message = '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+                self.stderr.write(f"Row {line}: {message}")
+
+        if self.dry_run:
+            for _, pedigree in rows:
+                if pedigree and any(parent and parent not in self.registrations for parent in pedigree[1:]):
+                    self.pending_parents[pedigree[0].registration_number] = pedigree[1:]
+        if self.dry_run or not rows:
+            return len(rows), sum(1 for _, pedigree in rows if pedigree), errors
+
+        dogs = fill_slugs([dog for dog, _ in rows])
+        with transaction.atomic():
+            Dog.objects.bulk_create(dogs)
+            if any(dog.pk is None for dog in dogs):
+                # Бэкенд не вернул id: находим их по заранее сгенерированным slug
+                ids = dict(Dog.objects.filter(slug__in=[dog.slug for dog in dogs]).values_list('slug', 'pk'))
+                for dog in dogs:
+                    dog.pk = ids[dog.slug]
+
+            for dog, pedigree in rows:
+                if pedigree:
+                    self.registrations[pedigree[0].registration_number] = dog.pk
+
+            pedigrees = []
+            for dog, pedigree in rows:
+                if not pedigree:
+                    continue
+                pedigree, father, mother = pedigree
+                pedigree.dog = dog
+                pedigree.father_id = self.registrations.get(father)
+                pedigree.mother_id = self.registrations.get(mother)
+                if any(parent and parent not in self.registrations for parent in (father, mother)):
+                    self.pending_parents[pedigree.registration_number] = (father, mother)
+                pedigrees.append(pedigree)
+
+            # Цикл возможен между собаками пакета, ссылающимися друг на друга
+            cycles = find_cycles({
+                pedigree.dog_id: (pedigree.father_id, pedigree.mother_id) for pedigree in pedigrees
+            })
+            for pedigree in pedigrees:
+                if pedigree.dog_id in cycles:
+                    self.stderr.write(f"Pedigree {pedigree.registration_number}: parents left empty. {CYCLE_ERROR}")
+                    pedigree.father_id = pedigree.mother_id = None
+                    self.pending_parents.pop(pedigree.registration_number, None)
+                    errors += 1
+
+            Pedigree.objects.bulk_create(pedigrees)
+            transaction.on_commit(lambda: get_search_backend().update_dogs(dogs))
+            # Без сигналов post_save закэшированные фрагменты списка и количество собак не сбрасываются
+            transaction.on_commit(lambda: bump_version(Dog, DOG_LIST_VERSION_PK))
+            # bulk_create не отправляет сигналы: таблицу замыкания обновляем явно в той же транзакции
+            update_closure([pedigree.dog_id for pedigree in pedigrees])
+
+        return len(dogs), len(pedigrees), errors
+
+    def link_pending_parents(self):
+        """
+        Второй проход: подставляет родителей, которые встретились в файле позже своих детей
+        Родители, которых нет ни в файле, ни в базе данных, и связи, образующие цикл, считаются ошибками.
+        Возвращает (обновлено родословных, ошибок)
+        """
+        if not self.pending_parents:
+            return 0, 0
+
+        if self.dry_run:
+            errors = 0
+            for number, parents in self.pending_parents.items():
+                for parent in parents:
+                    if parent and parent not in self.registrations and parent not in self.seen_numbers:
+                        self.stderr.write(f"Pedigree {number}: parent {parent} not found")
+                        errors += 1
+            return 0, errors
+
+        errors = 0
+        pedigrees = Pedigree.objects.in_bulk(list(self.pending_parents), field_name='registration_number')
+        links = {}
+        for number, (father, mother) in self.pending_parents.items():
+            pedigree = pedigrees[number]
+            for parent in (father, mother):
+                if parent and parent not in self.registrations:
+                    self.stderr.write(f"Pedigree {number}: parent {parent} not found, left empty")
+                    errors += 1
+            pedigree.father_id = self.registrations.get(father)
+            pedigree.mother_id = self.registrations.get(mother)
+            links[pedigree.dog_id] = (pedigree.father_id, pedigree.mother_id)
+
+        with transaction.atomic():
+            cycles = find_cycles(links)
+            updated = []
+            for pedigree in pedigrees.values():
+                if pedigree.dog_id in cycles:
+                    self.stderr.write(f"Pedigree {pedigree.registration_number}: parents left empty. {CYCLE_ERROR}")
+                    errors += 1
+                else:
+                    updated.append(pedigree)
+            Pedigree.objects.bulk_update(updated, ['father', 'mother'], batch_size=CLOSURE_BATCH_SIZE)
+            update_closure([pedigree.dog_id for pedigree in updated])
+            transaction.on_commit(lambda: bump_version(Pedigree, PEDIGREE_VERSION_PK))
+        return len(updated), errors
@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from dogs.ancestry import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pedigree closure table (ancestor, descendant, depth) from all pedigrees'
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = rebuild_closure()
+        self.stdout.write(self.style.SUCCESS(
+            f'Pedigree closure rebuilt: {rows} rows in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,15 @@
+import time
+from django.core.management.base import BaseCommand
+from dogs.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dog search index for the configured DOG_SEARCH_BACKEND'
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        started = time.perf_counter()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(backend).__name__} rebuilt in {time.perf_counter() - started:.2f}s'
+        ))
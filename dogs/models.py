@@ -1,20 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from datetime import date
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.core.mail import send_mail
-import random
-import string
-
-
-def generate_random_slug(length=8):
-    """
-    Генерирует случайный slug заданной длины
-    """
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
+from users.images import ImageVariantsMixin
+from users.slugs import UniqueSlugMixin
+from users.storage import get_media_storage
 
 
 class Breed(models.Model):
@@ -37,11 +28,15 @@ class Breed(models.Model):
     class Meta:
         verbose_name = _("Порода")
         verbose_name_plural = _("Породы")
+        indexes = [
+            models.Index(fields=['name'], name='breed_name_idx'),
+        ]
 
 
-class Dog(models.Model):
+class Dog(ImageVariantsMixin, UniqueSlugMixin, models.Model):
     """
     Модель для собаки
+    Slug генерируется автоматически при первом сохранении
     """
     objects = None
     name = models.CharField(
@@ -65,10 +60,17 @@ class Dog(models.Model):
     )
     photo = models.ImageField(
         upload_to='dogs/',
+        storage=get_media_storage,
         blank=True,
         null=True,
         verbose_name=_("Фото собаки")
     )
+    photo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_("Миниатюры фото")
+    )
     is_active = models.BooleanField(
         default=True,
         verbose_name=_("Активна")
@@ -86,18 +88,6 @@ class Dog(models.Model):
         unique=True, blank=True, null=True
     )
 
-    def save(self, *args, **kwargs):
-        """
-        Автоматически генерирует slug, если он не был указан
-        """
-        if not self.slug:
-            while True:
-                new_slug = generate_random_slug()
-                if not Dog.objects.filter(slug=new_slug).exists():
-                    self.slug = new_slug
-                    break
-        super().save(*args, **kwargs)
-
     def clean(self):
         """
          Дата рождения не может быть в будущем
@@ -115,12 +105,28 @@ class Dog(models.Model):
             age -= 1
         return age
 
+    image_variant_fields = {'photo': 'photo_variants'}
+
+    @property
+    def photo_images(self):
+        return self.get_image_variants('photo')
+
     def __str__(self):
         return _("{name} ({breed})").format(name=self.name, breed=self.breed)
 
     class Meta:
         verbose_name = _("Собака")
         verbose_name_plural = _("Собаки")
+        # Индексы под фильтрацию по активности и сортировки списка собак
+        indexes = [
+            models.Index(fields=['is_active', 'name'], name='dog_active_name_idx'),
+            models.Index(fields=['is_active', 'birth_date'], name='dog_active_birth_idx'),
+            models.Index(fields=['is_active', 'breed'], name='dog_active_breed_idx'),
+        ]
+
+
+# Ошибка проверки правила 3 (цикл в родословной), общая для формы и импорта
+CYCLE_ERROR = _("Собака не может быть предком своих родителей.")
 
 
 class Pedigree(models.Model):
@@ -164,13 +170,33 @@ class Pedigree(models.Model):
         Валидация для родословной:
         1. Собака не может быть своим же отцом или матерью
         2. Отец и мать не могут быть одной и той же собакой
+        3. Собака не может быть предком своих родителей (цикл через дедушек, бабушек и т.д.)
+        """
+        from .ancestry import creates_cycle
+
+        self.check_parents(self.dog_id, self.father_id, self.mother_id)
+
+        if creates_cycle(self.dog_id, self.father_id, self.mother_id):
+            raise ValidationError(CYCLE_ERROR)
+
+    @staticmethod
+    def check_parents(dog, father, mother):
+        """
+        Правила 1 и 2 для любых идентификаторов собак: id, объекты или регистрационные номера (импорт)
         """
-        if self.father == self.dog or self.mother == self.dog:
+        if dog and dog in (father, mother):
             raise ValidationError(_("Собака не может быть своим же отцом или матерью."))
 
-        if self.father and self.mother and self.father == self.mother:
+        if father and mother and father == mother:
             raise ValidationError(_("Отец и мать не могут быть одной и той же собакой."))
 
+    def save(self, *args, **kwargs):
+        """
+        Сохранение и пересчет таблицы замыкания (сигнал post_save) выполняются в одной транзакции
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Родословная {self.dog.name} (№{self.registration_number})"
 
@@ -179,19 +205,37 @@ class Pedigree(models.Model):
         verbose_name_plural = _("Родословные")
 
 
-@receiver(post_save, sender=Dog)
-def update_views_count(sender, instance, **kwargs):
+class PedigreeClosure(models.Model):
     """
-    Отправляет письмо владельцу, если количество просмотров собаки кратно 100
+    Таблица замыкания родословных: строка (предок, потомок, глубина) для каждой пары
+    Глубина 1 - родитель, 2 - дедушка/бабушка и т.д. (хранится кратчайший путь)
+    Поддерживается сервисом dogs.ancestry при изменении родословных
     """
-    if not kwargs.get('created'):
-        if instance.views_count % 100 == 0 and instance.owner:
-            subject = f"Ваша собака {instance.name} популярна!"
-            message = f"Карточка вашей собаки '{instance.name}' набрала {instance.views_count} просмотров."
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [instance.owner.email],
-                fail_silently=False,
-            )
+    ancestor = models.ForeignKey(
+        Dog,
+        on_delete=models.CASCADE,
+        related_name='descendant_links',
+        verbose_name=_("Предок")
+    )
+    descendant = models.ForeignKey(
+        Dog,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links',
+        verbose_name=_("Потомок")
+    )
+    depth = models.PositiveSmallIntegerField(
+        verbose_name=_("Поколение")
+    )
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    class Meta:
+        verbose_name = _("Связь предок-потомок")
+        verbose_name_plural = _("Связи предок-потомок")
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='pedigree_closure_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='pedigree_closure_desc_idx'),
+        ]
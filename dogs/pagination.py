@@ -0,0 +1,136 @@
+import base64
+import datetime
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .services import make_dog_key
+
+
+class InvalidCursor(ValueError):
+    """
+    Курсор пагинации поврежден или не соответствует текущей сортировке
+    """
+
+
+class KeysetPage:
+    """
+    Страница, полученная курсорной пагинацией
+    Повторяет интерфейс django.core.paginator.Page, который используется в шаблонах
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Курсорная (keyset) пагинация по полю сортировки и pk
+    Вместо OFFSET используется условие (поле, pk) > (значение, pk последней записи),
+    поэтому любая страница стоит столько же, сколько первая.
+    Общее количество записей не считается на каждый запрос, а кэшируется на count_timeout секунд.
+    """
+
+    def __init__(self, queryset, sort_field, per_page, count_timeout=0):
+        self.queryset = queryset
+        self.sort_field = sort_field
+        self.per_page = per_page
+        self.count_timeout = count_timeout
+        self.field = queryset.model._meta.get_field(sort_field)
+
+    def encode_cursor(self, obj, direction):
+        """
+        Кодирует позицию записи в строку курсора
+        """
+        value = getattr(obj, self.field.attname)
+        if isinstance(value, datetime.datetime):
+            # DjangoJSONEncoder отбрасывает микросекунды, а курсору нужно точное значение
+            value = value.isoformat()
+        payload = {
+            'f': self.sort_field,
+            'v': value,
+            'pk': obj.pk,
+            'd': direction,
+        }
+        data = json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Декодирует строку курсора в (значение, pk, направление)
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if payload['f'] != self.sort_field or payload['d'] not in ('next', 'prev'):
+                raise InvalidCursor(cursor)
+            return self.field.to_python(payload['v']), int(payload['pk']), payload['d']
+        except (ValueError, TypeError, KeyError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def page(self, cursor=None):
+        """
+        Возвращает страницу, начинающуюся после (или заканчивающуюся перед) позицией курсора
+        """
+        name = self.sort_field
+        queryset = self.queryset
+
+        if not cursor:
+            object_list = list(queryset.order_by(name, 'pk')[:self.per_page + 1])
+            has_more = len(object_list) > self.per_page
+            object_list = object_list[:self.per_page]
+            has_before = False
+        else:
+            value, pk, direction = self.decode_cursor(cursor)
+            if direction == 'next':
+                queryset = queryset.filter(Q(**{f'{name}__gt': value}) | Q(**{name: value, 'pk__gt': pk}))
+                object_list = list(queryset.order_by(name, 'pk')[:self.per_page + 1])
+                has_more = len(object_list) > self.per_page
+                object_list = object_list[:self.per_page]
+                has_before = True
+            else:
+                queryset = queryset.filter(Q(**{f'{name}__lt': value}) | Q(**{name: value, 'pk__lt': pk}))
+                object_list = list(queryset.order_by(f'-{name}', '-pk')[:self.per_page + 1])
+                has_before = len(object_list) > self.per_page
+                object_list = object_list[:self.per_page][::-1]
+                has_more = True
+
+        next_cursor = previous_cursor = None
+        if object_list and has_more:
+            next_cursor = self.encode_cursor(object_list[-1], 'next')
+        if object_list and has_before:
+            previous_cursor = self.encode_cursor(object_list[0], 'prev')
+        return KeysetPage(object_list, self, next_cursor, previous_cursor)
+
+    @cached_property
+    def count(self):
+        """
+        Приблизительное (кэшированное) количество записей
+        Если кэширование отключено (count_timeout = 0), количество не считается и возвращается None
+        """
+        if not self.count_timeout:
+            return None
+        digest = hashlib.md5(str(self.queryset.query).encode('utf-8')).hexdigest()
+        return cache.get_or_set(
+            make_dog_key(f"dog_list_count_{digest}"), self.queryset.count, timeout=self.count_timeout
+        )
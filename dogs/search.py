@@ -0,0 +1,434 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Breed, Dog
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ кэша с номером последнего изменения поискового индекса, общим для всех процессов
+SEARCH_INDEX_VERSION_KEY = 'dog_search_index_version'
+
+# Ограничение SQL Server на количество параметров запроса (с запасом)
+SQL_SERVER_MAX_PARAMS = 2000
+
+NGRAM_SIZE = 3
+
+
+def normalize(text):
+    return (text or '').strip().lower()
+
+
+def make_ngrams(text, size=NGRAM_SIZE):
+    """
+    Разбивает строку на n-граммы
+    """
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def filter_by_ids(queryset, ids):
+    """
+    Оставляет в queryset записи с указанными pk
+    SQL Server принимает не больше 2100 параметров запроса, поэтому длинный список передается одной строкой JSON.
+    """
+    ids = sorted(ids)
+    if connections[queryset.db].vendor == 'microsoft' and len(ids) > SQL_SERVER_MAX_PARAMS:
+        return queryset.filter(pk__in=RawSQL('SELECT CAST([value] AS bigint) FROM OPENJSON(%s)', [json.dumps(ids)]))
+    return queryset.filter(pk__in=ids)
+
+
+class SearchBackend:
+    """
+    Базовый класс поискового бэкенда для списка собак
+    filter_queryset() оставляет в queryset найденных собак, порядок задает представление
+    """
+
+    def filter_queryset(self, queryset, query='', breed_query=''):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """
+        Полностью перестраивает индекс
+        """
+
+    def update_dog(self, dog):
+        pass
+
+    def update_dogs(self, dogs):
+        for dog in dogs:
+            self.update_dog(dog)
+
+    def remove_dog(self, dog_id):
+        pass
+
+    def update_breed(self, breed):
+        pass
+
+    def remove_breed(self, breed_id):
+        pass
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """
+    Поиск через LIKE '%...%' в базе данных (поведение по умолчанию до появления индекса)
+    """
+
+    def filter_queryset(self, queryset, query='', breed_query=''):
+        if query:
+            queryset = queryset.filter(name__icontains=query)
+        if breed_query:
+            queryset = queryset.filter(breed__name__icontains=breed_query)
+        return queryset
+
+
+def get_change_key(version):
+    return f"dog_search_change_{version}"
+
+
+class NgramSearchBackend(SearchBackend):
+    """
+    Инвертированный индекс по триграммам кличек собак и названий пород в памяти процесса
+    Индекс обновляется сигналами post_save/post_delete. Каждое изменение получает номер версии
+    (счетчик в кэше) и записывается в кэш, другие процессы применяют пропущенные изменения к своему индексу.
+    Полностью индекс загружается из снимка на диске (с догоняющими изменениями) или перестраивается по базе данных,
+    только если изменений пропущено слишком много или они вытеснены из кэша.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.DOG_SEARCH_INDEX_PATH
+        self.lock = threading.RLock()
+        self.version = None
+        self.saved_version = None
+        self.missing_since = None
+        self.dog_names = {}
+        self.dog_breeds = {}
+        self.breed_names = {}
+        self.breed_dogs = defaultdict(set)
+        self.name_index = defaultdict(set)
+        self.breed_index = defaultdict(set)
+
+    def clear(self):
+        self.dog_names.clear()
+        self.dog_breeds.clear()
+        self.breed_names.clear()
+        self.breed_dogs.clear()
+        self.name_index.clear()
+        self.breed_index.clear()
+
+    def get_current_version(self):
+        """
+        Номер последнего опубликованного изменения
+        Счетчик создается со значением time_ns, поэтому после вытеснения из кэша он только растет.
+        """
+        version = cache.get(SEARCH_INDEX_VERSION_KEY)
+        if version is None:
+            cache.add(SEARCH_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(SEARCH_INDEX_VERSION_KEY)
+        return version
+
+    def publish(self, change):
+        """
+        Публикует изменение для других процессов и возвращает его номер
+        """
+        try:
+            version = cache.incr(SEARCH_INDEX_VERSION_KEY)
+        except ValueError:
+            self.get_current_version()
+            version = cache.incr(SEARCH_INDEX_VERSION_KEY)
+        cache.set(get_change_key(version), change, timeout=settings.DOG_SEARCH_CHANGE_TIMEOUT)
+        return version
+
+    def rebuild(self):
+        """
+        Загружает клички и породы из базы данных и сохраняет индекс на диск
+        Версия читается до загрузки: изменения, опубликованные позже, будут применены поверх.
+        """
+        with self.lock:
+            version = self.get_current_version()
+            self.clear()
+            for breed_id, name in Breed.objects.values_list('pk', 'name').iterator():
+                self._add_breed(breed_id, name)
+            for dog_id, name, breed_id in Dog.objects.values_list('pk', 'name', 'breed_id').iterator():
+                self._add_dog(dog_id, name, breed_id)
+            self.version = version
+            self.missing_since = None
+            logger.info(f"Поисковый индекс перестроен: {len(self.dog_names)} собак, {len(self.breed_names)} пород.")
+            self.save()
+
+    def save(self):
+        """
+        Сохраняет снимок индекса на диск
+        """
+        if not self.path:
+            return
+        state = {
+            'version': self.version,
+            'dog_names': self.dog_names,
+            'dog_breeds': self.dog_breeds,
+            'breed_names': self.breed_names,
+        }
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'wb') as index_file:
+                pickle.dump(state, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.saved_version = self.version
+        except OSError as exc:
+            logger.warning(f"Не удалось сохранить поисковый индекс в {self.path}: {exc}")
+
+    def load(self):
+        """
+        Загружает снимок индекса с диска, изменения после снимка применяет catch_up
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as index_file:
+                state = pickle.load(index_file)
+        except (OSError, pickle.UnpicklingError, EOFError) as exc:
+            logger.warning(f"Не удалось загрузить поисковый индекс из {self.path}: {exc}")
+            return False
+        if state['version'] is None:
+            return False
+
+        with self.lock:
+            self.clear()
+            for breed_id, name in state['breed_names'].items():
+                self._add_breed(breed_id, name)
+            for dog_id, name in state['dog_names'].items():
+                self._add_dog(dog_id, name, state['dog_breeds'][dog_id])
+            self.version = self.saved_version = state['version']
+            self.missing_since = None
+        return True
+
+    def catch_up(self, current):
+        """
+        Применяет к индексу изменения с номерами от self.version + 1 до current
+        Возвращает False, если индекс нельзя догнать: изменений слишком много или они вытеснены из кэша.
+        Изменение, номер которого уже выдан, но которое еще не записано в кэш, ждем до DOG_SEARCH_CHANGE_WAIT секунд.
+        """
+        if self.version is None or current < self.version:
+            return False
+        if current - self.version > settings.DOG_SEARCH_MAX_CATCHUP:
+            return False
+
+        versions = range(self.version + 1, current + 1)
+        changes = cache.get_many([get_change_key(version) for version in versions])
+        for version in versions:
+            change = changes.get(get_change_key(version))
+            if change is None:
+                if self.missing_since is None:
+                    self.missing_since = time.monotonic()
+                return time.monotonic() - self.missing_since < settings.DOG_SEARCH_CHANGE_WAIT
+            self._apply(change)
+            self.version = version
+            self.missing_since = None
+
+        if self.saved_version is None or self.version - self.saved_version >= settings.DOG_SEARCH_SNAPSHOT_INTERVAL:
+            self.save()
+        return True
+
+    def ensure_fresh(self):
+        """
+        Догоняет версию в кэше: применяет пропущенные изменения,
+        при невозможности загружает снимок или перестраивает индекс
+        """
+        current = self.get_current_version()
+        if self.version is not None and self.version == current:
+            return
+        with self.lock:
+            if self.catch_up(current):
+                return
+            if not (self.load() and self.catch_up(current)):
+                self.rebuild()
+
+    def _add_dog(self, dog_id, name, breed_id):
+        name = normalize(name)
+        self.dog_names[dog_id] = name
+        self.dog_breeds[dog_id] = breed_id
+        self.breed_dogs[breed_id].add(dog_id)
+        for gram in make_ngrams(name):
+            self.name_index[gram].add(dog_id)
+
+    def _remove_dog(self, dog_id):
+        name = self.dog_names.pop(dog_id, None)
+        if name is None:
+            return
+        breed_id = self.dog_breeds.pop(dog_id)
+        self.breed_dogs[breed_id].discard(dog_id)
+        for gram in make_ngrams(name):
+            self.name_index[gram].discard(dog_id)
+
+    def _add_breed(self, breed_id, name):
+        name = normalize(name)
+        self.breed_names[breed_id] = name
+        for gram in make_ngrams(name):
+            self.breed_index[gram].add(breed_id)
+
+    def _remove_breed(self, breed_id):
+        name = self.breed_names.pop(breed_id, None)
+        if name is None:
+            return
+        for gram in make_ngrams(name):
+            self.breed_index[gram].discard(breed_id)
+
+    def _apply(self, change):
+        """
+        Применяет изменение ('dogs', [(pk, кличка, порода)]), ('remove_dog', pk),
+        ('breed', pk, название) или ('remove_breed', pk)
+        Повторное применение ничего не меняет, поэтому порядок своих и чужих изменений не важен.
+        """
+        kind, *args = change
+        if kind == 'dogs':
+            for dog_id, name, breed_id in args[0]:
+                self._remove_dog(dog_id)
+                self._add_dog(dog_id, name, breed_id)
+        elif kind == 'remove_dog':
+            self._remove_dog(args[0])
+        elif kind == 'breed':
+            self._remove_breed(args[0])
+            self._add_breed(args[0], args[1])
+        elif kind == 'remove_breed':
+            self._remove_breed(args[0])
+
+    def _apply_change(self, change):
+        """
+        Применяет изменение к своему индексу и публикует его для других процессов
+        """
+        with self.lock:
+            self._apply(change)
+            version = self.publish(change)
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def update_dog(self, dog):
+        self.update_dogs([dog])
+
+    def update_dogs(self, dogs):
+        """
+        Добавляет в индекс пакет собак (например, после bulk_create) одним изменением
+        """
+        self._apply_change(('dogs', [(dog.pk, dog.name, dog.breed_id) for dog in dogs]))
+
+    def remove_dog(self, dog_id):
+        self._apply_change(('remove_dog', dog_id))
+
+    def update_breed(self, breed):
+        self._apply_change(('breed', breed.pk, breed.name))
+
+    def remove_breed(self, breed_id):
+        self._apply_change(('remove_breed', breed_id))
+
+    def _match(self, query, names, index):
+        """
+        Возвращает id записей, название которых содержит query
+        Кандидаты отбираются пересечением списков триграмм и проверяются поиском подстроки
+        """
+        grams = make_ngrams(query)
+        if grams:
+            postings = sorted((index.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            candidates = names.keys()
+        return [item_id for item_id in candidates if query in names[item_id]]
+
+    def search(self, query='', breed_query=''):
+        """
+        Возвращает множество pk собак, кличка и порода которых содержат query и breed_query
+        """
+        query = normalize(query)
+        breed_query = normalize(breed_query)
+        self.ensure_fresh()
+
+        with self.lock:
+            dog_ids = None
+            if query:
+                dog_ids = set(self._match(query, self.dog_names, self.name_index))
+            if breed_query:
+                breed_dog_ids = set()
+                for breed_id in self._match(breed_query, self.breed_names, self.breed_index):
+                    breed_dog_ids |= self.breed_dogs.get(breed_id, set())
+                dog_ids = breed_dog_ids if dog_ids is None else dog_ids & breed_dog_ids
+            if dog_ids is None:
+                dog_ids = set(self.dog_names)
+        return dog_ids
+
+    def filter_queryset(self, queryset, query='', breed_query=''):
+        if not normalize(query) and not normalize(breed_query):
+            return queryset
+        return filter_by_ids(queryset, self.search(query, breed_query))
+
+
+class SqlServerFullTextSearchBackend(SearchBackend):
+    """
+    Полнотекстовый поиск SQL Server (CONTAINSTABLE) по кличкам собак и названиям пород
+    Полнотекстовый поиск ищет слова по префиксу, а не произвольные подстроки.
+    rebuild() создает полнотекстовый каталог и индексы, если их еще нет.
+    """
+    catalog_name = 'dogs_search_catalog'
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{self.catalog_name}') "
+                f"CREATE FULLTEXT CATALOG {self.catalog_name}"
+            )
+            for model in (Dog, Breed):
+                table = model._meta.db_table
+                cursor.execute(
+                    f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('{table}')) "
+                    f"BEGIN "
+                    f"DECLARE @pk sysname = (SELECT name FROM sys.indexes "
+                    f"WHERE object_id = OBJECT_ID('{table}') AND is_primary_key = 1); "
+                    f"EXEC('CREATE FULLTEXT INDEX ON {table}(name) KEY INDEX ' + QUOTENAME(@pk) + "
+                    f"' ON {self.catalog_name} WITH CHANGE_TRACKING AUTO'); "
+                    f"END"
+                )
+
+    @staticmethod
+    def make_condition(query):
+        """
+        Превращает строку поиска в условие CONTAINS: каждое слово ищется по префиксу
+        """
+        words = [word.replace('"', '') for word in query.split()]
+        return ' AND '.join(f'"{word}*"' for word in words if word)
+
+    def filter_queryset(self, queryset, query='', breed_query=''):
+        condition = self.make_condition(query)
+        breed_condition = self.make_condition(breed_query)
+        if condition:
+            queryset = queryset.filter(pk__in=RawSQL(
+                f"SELECT [KEY] FROM CONTAINSTABLE({Dog._meta.db_table}, name, %s)", [condition]
+            ))
+        if breed_condition:
+            queryset = queryset.filter(breed_id__in=RawSQL(
+                f"SELECT [KEY] FROM CONTAINSTABLE({Breed._meta.db_table}, name, %s)", [breed_condition]
+            ))
+        return queryset
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """
+    Возвращает экземпляр поискового бэкенда из настройки DOG_SEARCH_BACKEND
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.DOG_SEARCH_BACKEND)()
+    return _backend
@@ -1,67 +1,339 @@
 import logging
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from .models import Dog
+from django.db import DEFAULT_DB_ALIAS
+from .models import Breed, Dog
 
 
 logger = logging.getLogger(__name__)
 
+# Время жизни закэшированной собаки
+DOG_CACHE_TIMEOUT = 600
 
-def get_cache_key(slug=None, pk=None):
+# Блокировка на загрузку собаки из базы данных при промахе кэша
+DOG_CACHE_LOCK_TIMEOUT = 10
+DOG_CACHE_LOCK_WAIT = 2.0
+DOG_CACHE_LOCK_POLL = 0.05
+
+# Время жизни ключей версий объектов
+# Истекшая версия создается заново и просто делает зависимые записи недействительными
+VERSION_TIMEOUT = 60 * 60 * 24
+
+# Поколение кэша собак: все ключи собак содержат его номер,
+# поэтому очистка всего кэша собак - это увеличение одного счетчика
+DOG_CACHE_GENERATION_KEY = 'dog_cache_generation'
+
+# Версия списка собак: увеличивается при изменении любой собаки, породы или владельца
+# и делает недействительными закэшированные фрагменты списка и карточек собак
+DOG_LIST_VERSION_PK = 'list'
+
+# Поля владельца, которые хранятся в кэше вместе с собакой
+OWNER_CACHED_FIELDS = ('id', 'username', 'email', 'slug', 'role')
+
+
+def get_generation():
+    """
+    Возвращает текущее поколение кэша собак
+    """
+    generation = cache.get(DOG_CACHE_GENERATION_KEY)
+    if generation is None:
+        cache.add(DOG_CACHE_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(DOG_CACHE_GENERATION_KEY)
+    return generation
+
+
+async def aget_generation():
+    """
+    Асинхронная версия get_generation для асинхронных представлений
+    """
+    generation = await cache.aget(DOG_CACHE_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(DOG_CACHE_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(DOG_CACHE_GENERATION_KEY)
+    return generation
+
+
+def make_dog_key(key, generation=None):
+    """
+    Добавляет к ключу пространство имен кэша собак: dogs:<поколение>:<ключ>
+    """
+    if generation is None:
+        generation = get_generation()
+    return f"dogs:{generation}:{key}"
+
+
+def get_cache_key(slug=None, pk=None, generation=None):
     """
     Генерирует ключ кэша на основе slug или pk
+    По ключу slug хранится pk собаки, по ключу pk - данные собаки
     """
     if slug:
-        return f"dog_slug_{slug}"
+        return make_dog_key(f"dog_slug_{slug}", generation)
     elif pk:
-        return f"dog_pk_{pk}"
+        return make_dog_key(f"dog_pk_{pk}", generation)
     return None
 
 
+def get_version_key(model, pk):
+    """
+    Ключ версии объекта: dog_version_1, breed_version_1, customuser_version_1
+    """
+    return f"{model._meta.model_name}_version_{pk}"
+
+
+def get_versions(keys):
+    """
+    Получает версии объектов одним запросом
+    Отсутствующие версии создаются заново, чтобы старые данные в кэше перестали им соответствовать
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+async def aget_versions(keys):
+    """
+    Асинхронная версия get_versions для асинхронных представлений
+    """
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+            versions[key] = await cache.aget(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(model, pk):
+    """
+    Увеличивает версию объекта, делая недействительными все закэшированные данные, которые от него зависят
+    """
+    key = get_version_key(model, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+    if settings.DB_REPLICAS:
+        # Реплики могут отставать: некоторое время объект загружается в кэш из основной базы
+        cache.set(f"{key}_written", 1, timeout=settings.DB_REPLICA_STICKY_SECONDS)
+
+
+def is_recently_written(keys):
+    """
+    Изменялся ли какой-либо из объектов (по ключам версий) за последние DB_REPLICA_STICKY_SECONDS
+    """
+    return bool(cache.get_many([f"{key}_written" for key in keys]))
+
+
+def get_dog_versions(dog_id, breed_id, owner_id):
+    return get_versions([
+        get_version_key(Dog, dog_id),
+        get_version_key(Breed, breed_id),
+        get_version_key(get_user_model(), owner_id),
+    ])
+
+
+def serialize_dog(dog):
+    """
+    Компактное представление собаки для кэша: словари со значениями полей вместо pickle модели
+    """
+    return {
+        'dog': {field.attname: getattr(dog, field.attname) for field in Dog._meta.concrete_fields},
+        'breed': {field.attname: getattr(dog.breed, field.attname) for field in Breed._meta.concrete_fields},
+        'owner': {name: getattr(dog.owner, name) for name in OWNER_CACHED_FIELDS},
+    }
+
+
+def deserialize_dog(data):
+    """
+    Восстанавливает объект Dog (вместе с breed и owner) из компактного представления
+    """
+    dog = Dog.from_db('default', list(data['dog']), list(data['dog'].values()))
+    dog.breed = Breed.from_db('default', list(data['breed']), list(data['breed'].values()))
+    dog.owner = get_user_model().from_db('default', list(data['owner']), list(data['owner'].values()))
+    return dog
+
+
+def load_dog(slug=None, pk=None, using=None):
+    """
+    Загружает собаку из базы данных (по умолчанию базу выбирает маршрутизатор, обычно реплика)
+    """
+    queryset = Dog.objects.using(using).select_related('breed', 'owner')
+    if slug:
+        return queryset.get(slug=slug)
+    return queryset.get(pk=pk)
+
+
+def get_cached_dog(pk, generation=None):
+    """
+    Возвращает собаку из кэша, если данные соответствуют текущим версиям собаки, породы и владельца
+    """
+    entry = cache.get(get_cache_key(pk=pk, generation=generation))
+    if not entry:
+        return None
+    dog = entry['data']['dog']
+    if entry['versions'] != get_dog_versions(pk, dog['breed_id'], dog['owner_id']):
+        return None
+    return deserialize_dog(entry['data'])
+
+
+def store_dog(dog, dog_version=None, generation=None):
+    """
+    Сохраняет собаку в кэш вместе с версиями, на которых она основана
+    dog_version, прочитанная до загрузки из базы данных, не дает сохранить данные,
+    измененные во время загрузки, под новой версией
+    """
+    versions = get_dog_versions(dog.pk, dog.breed_id, dog.owner_id)
+    if dog_version is not None:
+        versions = (dog_version,) + versions[1:]
+    if generation is None:
+        generation = get_generation()
+    cache.set_many({
+        get_cache_key(pk=dog.pk, generation=generation): {'versions': versions, 'data': serialize_dog(dog)},
+        get_cache_key(slug=dog.slug, generation=generation): dog.pk,
+    }, timeout=DOG_CACHE_TIMEOUT)
+
+
 def get_dog_from_cache(slug=None, pk=None):
     """
     Получает объект Dog из кэша по slug или pk
     Если объекта нет в кэше, загружает его из базы данных и сохраняет в кэш
+    При промахе загрузку выполняет только один запрос, остальные ждут появления данных в кэше
     """
-    cache_key = get_cache_key(slug=slug, pk=pk)
-    if not cache_key:
+    if not slug and not pk:
         logger.warning("Не указан slug или pk для получения объекта Dog.")
         return None
 
-    dog = cache.get(cache_key)
+    generation = get_generation()
+    if slug:
+        pk = cache.get(get_cache_key(slug=slug, generation=generation)) or None
 
-    if not dog:
-        logger.info(f"Объект Dog с ключом {cache_key} не найден в кэше. Загрузка из базы данных.")
-        try:
-            if slug:
-                dog = Dog.objects.select_related('breed', 'owner').get(slug=slug)
-            elif pk:
-                dog = Dog.objects.select_related('breed', 'owner').get(pk=pk)
+    if pk:
+        dog = get_cached_dog(pk, generation)
+        if dog:
+            return dog
 
-            cache.set(cache_key, dog, timeout=600)
-            logger.info(f"Объект Dog с ключом {cache_key} сохранен в кэш.")
-        except Dog.DoesNotExist:
-            logger.error(f"Объект Dog с ключом {cache_key} не существует в базе данных.")
-            return None
+    cache_key = get_cache_key(slug=slug, pk=pk, generation=generation)
+    lock_key = f"{cache_key}_lock"
+    logger.info(f"Объект Dog с ключом {cache_key} не найден в кэше. Загрузка из базы данных.")
 
-    return dog
+    if not cache.add(lock_key, 1, timeout=DOG_CACHE_LOCK_TIMEOUT):
+        # Загрузку уже выполняет другой запрос - ждем его результат
+        deadline = time.monotonic() + DOG_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(DOG_CACHE_LOCK_POLL)
+            if not pk:
+                pk = cache.get(get_cache_key(slug=slug, generation=generation))
+            dog = get_cached_dog(pk, generation) if pk else None
+            if dog:
+                return dog
+        lock_key = None
+
+    try:
+        dog_version = get_versions([get_version_key(Dog, pk)])[0] if pk else None
+        dog = load_dog(slug=slug, pk=pk)
+        if dog._state.db != DEFAULT_DB_ALIAS and is_recently_written([
+            get_version_key(Dog, dog.pk),
+            get_version_key(Breed, dog.breed_id),
+            get_version_key(get_user_model(), dog.owner_id),
+        ]):
+            # Реплика могла еще не получить последние изменения, а кэш общий для всех пользователей
+            dog = load_dog(pk=dog.pk, using=DEFAULT_DB_ALIAS)
+        store_dog(dog, dog_version, generation)
+        logger.info(f"Объект Dog с ключом {cache_key} сохранен в кэш.")
+        return dog
+    except Dog.DoesNotExist:
+        logger.error(f"Объект Dog с ключом {cache_key} не существует в базе данных.")
+        return None
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+
+
+def get_dog_cache_keys(pk, slug, generation):
+    """
+    Все ключи кэша одной собаки: данные, slug, версия
+    """
+    keys = [get_cache_key(pk=pk, generation=generation), get_version_key(Dog, pk)]
+    if slug:
+        keys.append(get_cache_key(slug=slug, generation=generation))
+    return keys
 
 
 def clear_dog_cache(slug=None, pk=None):
     """
     Очищает кэш для конкретной собаки по slug или pk
+    Недостающий идентификатор берется из базы данных, чтобы удалить обе формы ключа
+    Все ключи удаляются одним запросом к кэшу
     """
-    cache_key = get_cache_key(slug=slug, pk=pk)
-    if not cache_key:
+    if not slug and not pk:
         logger.warning("Не указан slug или pk для очистки кэша.")
         return
 
-    cache.delete(cache_key)
-    logger.info(f"Кэш для объекта Dog с ключом {cache_key} очищен.")
+    lookup = {'slug': slug} if slug else {'pk': pk}
+    identifiers = Dog.objects.filter(**lookup).values_list('pk', 'slug').first()
+    if identifiers:
+        pk, slug = identifiers
+
+    generation = get_generation()
+    keys = [get_cache_key(slug=slug, generation=generation)] if slug else []
+    if pk:
+        keys = get_dog_cache_keys(pk, slug, generation)
+    cache.delete_many(keys)
+    bump_version(Dog, DOG_LIST_VERSION_PK)
+    logger.info(f"Кэш для объекта Dog (pk={pk}, slug={slug}) очищен.")
+
+
+def filter_dogs(dog_ids=None, owner_id=None, breed_id=None):
+    """
+    Собаки по списку id и/или владельцу и породе
+    """
+    queryset = Dog.objects.all()
+    if dog_ids:
+        queryset = queryset.filter(pk__in=dog_ids)
+    if owner_id:
+        queryset = queryset.filter(owner_id=owner_id)
+    if breed_id:
+        queryset = queryset.filter(breed_id=breed_id)
+    return queryset
+
+
+def clear_dogs_cache(queryset, batch_size=500):
+    """
+    Очищает кэш для всех собак из queryset
+    Ключи удаляются пакетами по batch_size собак через delete_many
+    Возвращает количество обработанных собак
+    """
+    generation = get_generation()
+    count = 0
+    keys = []
+    for pk, slug in queryset.values_list('pk', 'slug').iterator(chunk_size=batch_size):
+        keys.extend(get_dog_cache_keys(pk, slug, generation))
+        count += 1
+        if count % batch_size == 0:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
+    if count:
+        bump_version(Dog, DOG_LIST_VERSION_PK)
+
+    logger.info(f"Кэш очищен для {count} собак.")
+    return count
 
 
 def clear_all_cache():
     """
     Очищает весь кэш, связанный с собаками
+    Увеличивает поколение кэша собак: старые ключи больше не читаются и истекают сами,
+    сессии и остальные данные в кэше не затрагиваются
     """
     logger.info("Очистка всего кэша, связанного с собаками.")
-    cache.clear()
+    try:
+        cache.incr(DOG_CACHE_GENERATION_KEY)
+    except ValueError:
+        cache.set(DOG_CACHE_GENERATION_KEY, time.time_ns(), timeout=None)
@@ -0,0 +1,198 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_init, pre_delete
+from django.dispatch import receiver
+from .ancestry import bump_ancestry_versions, get_children_ids, get_descendant_ids, update_closure
+from .models import Breed, Dog, Pedigree
+from .search import get_search_backend
+from .services import DOG_LIST_VERSION_PK, bump_version
+from users.images import image_variants_saved, schedule_image_variants
+from users.services import release_file_references, remember_stored_files, update_file_references
+
+
+@receiver(post_save, sender=Dog)
+def index_dog(sender, instance, **kwargs):
+    """
+    Обновляет поисковый индекс после сохранения собаки
+    """
+    transaction.on_commit(lambda: get_search_backend().update_dog(instance))
+
+
+@receiver(post_delete, sender=Dog)
+def unindex_dog(sender, instance, **kwargs):
+    """
+    Удаляет собаку из поискового индекса
+    """
+    dog_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_dog(dog_id))
+
+
+@receiver(post_save, sender=Breed)
+def index_breed(sender, instance, **kwargs):
+    """
+    Обновляет поисковый индекс после сохранения породы
+    """
+    transaction.on_commit(lambda: get_search_backend().update_breed(instance))
+
+
+@receiver(post_delete, sender=Breed)
+def unindex_breed(sender, instance, **kwargs):
+    """
+    Удаляет породу из поискового индекса
+    """
+    breed_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_breed(breed_id))
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+@receiver(post_save, sender=Breed)
+@receiver(post_delete, sender=Breed)
+def invalidate_cached_object(sender, instance, **kwargs):
+    """
+    Делает недействительным кэш собак, зависящий от измененного объекта
+    Версия увеличивается после фиксации транзакции, чтобы кэш не заполнился старыми данными
+    pk запоминается сразу: после удаления Django обнуляет instance.pk
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: bump_version(sender, pk))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_owner(sender, instance, **kwargs):
+    """
+    Делает недействительным кэш собак пользователя
+    Обновление только даты последнего входа на закэшированные данные не влияет
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: bump_version(sender, pk))
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+@receiver(post_save, sender=Breed)
+@receiver(post_delete, sender=Breed)
+def invalidate_cached_fragments(sender, instance, **kwargs):
+    """
+    Делает недействительными закэшированные фрагменты списка собак
+    """
+    transaction.on_commit(lambda: bump_version(Dog, DOG_LIST_VERSION_PK))
+
+
+@receiver(post_init, sender=Dog)
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_listed_fields(sender, instance, **kwargs):
+    """
+    Запоминает поля, которые показываются в чужих списках и карточках: кличка и slug собаки, имя владельца
+    Отложенные поля (only/defer) не загружаются
+    """
+    fields = ('name', 'slug') if sender is Dog else ('username',)
+    instance._listed_fields = tuple(instance.__dict__.get(field) for field in fields)
+
+
+def listed_fields_changed(instance, fields):
+    previous = getattr(instance, '_listed_fields', None)
+    current = tuple(getattr(instance, field) for field in fields)
+    instance._listed_fields = current
+    return previous != current
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_owner_fragments(sender, instance, created, **kwargs):
+    """
+    Список собак показывает только имя владельца: фрагменты сбрасываются, когда меняется имя владельца собак
+    Остальные изменения пользователей (профиль, аватар, роль, статистика отзывов) список не затрагивают
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'username' not in update_fields:
+        return
+    if not listed_fields_changed(instance, ('username',)) or created:
+        return
+    if Dog.objects.filter(owner_id=instance.pk).exists():
+        transaction.on_commit(lambda: bump_version(Dog, DOG_LIST_VERSION_PK))
+
+
+@receiver(post_save, sender=Dog)
+def invalidate_descendant_ancestry(sender, instance, created, **kwargs):
+    """
+    Карточки потомков показывают кличку и ссылку на собаку: при их изменении сбрасываются предки потомков
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & {'name', 'slug'}:
+        return
+    if not listed_fields_changed(instance, ('name', 'slug')) or created:
+        return
+    descendants = get_descendant_ids(instance.pk)
+    if descendants:
+        transaction.on_commit(lambda: bump_ancestry_versions(descendants))
+
+
+@receiver(post_save, sender=Pedigree)
+@receiver(post_delete, sender=Pedigree)
+def update_pedigree_closure(sender, instance, **kwargs):
+    """
+    Пересчитывает таблицу замыкания для собаки, у которой изменились родители, и ее потомков
+    Выполняется в транзакции изменения: Pedigree.save и удаление (Collector) атомарны
+    Закэшированные предки сбрасываются только у затронутых собак
+    """
+    affected = update_closure([instance.dog_id])
+    transaction.on_commit(lambda: bump_ancestry_versions(affected))
+
+
+@receiver(pre_delete, sender=Dog)
+def remember_pedigree_children(sender, instance, **kwargs):
+    """
+    Запоминает детей удаляемой собаки: ссылки на нее обнулятся без сигналов Pedigree
+    """
+    instance._pedigree_children = get_children_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Dog)
+def update_children_closure(sender, instance, **kwargs):
+    """
+    Пересчитывает таблицу замыкания для потомков удаленной собаки в транзакции удаления
+    """
+    children = getattr(instance, '_pedigree_children', None)
+    if children:
+        affected = update_closure(children)
+        transaction.on_commit(lambda: bump_ancestry_versions(affected))
+
+
+@receiver(post_save, sender=Dog)
+def generate_photo_variants(sender, instance, **kwargs):
+    """
+    Создает миниатюры фото собаки в фоновом потоке после фиксации транзакции
+    """
+    schedule_image_variants(instance, 'photo')
+
+
+@receiver(image_variants_saved, sender=Dog)
+def invalidate_cached_photo(sender, instance, **kwargs):
+    """
+    Готовые миниатюры меняют только карточку собаки: поисковый индекс и список не сбрасываются
+    Список показывает оригинал фото, пока не истечет время жизни его фрагментов
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: bump_version(Dog, pk))
+
+
+@receiver(post_init, sender=Dog)
+def remember_photo_files(sender, instance, **kwargs):
+    remember_stored_files(instance)
+
+
+@receiver(post_save, sender=Dog)
+def update_photo_references(sender, instance, created, **kwargs):
+    """
+    Обновляет счетчики ссылок на файлы фото и его миниатюр
+    """
+    update_file_references(instance, created)
+
+
+@receiver(post_delete, sender=Dog)
+def release_photo_references(sender, instance, **kwargs):
+    release_file_references(instance)
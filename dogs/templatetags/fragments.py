@@ -0,0 +1,35 @@
+from django import template
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name):
+        self.nodelist = nodelist
+        self.name = name
+
+    def render(self, context):
+        fragments = context.get('fragment_cache')
+        if fragments is None:
+            return self.nodelist.render(context)
+        name = self.name.resolve(context)
+        html = fragments.get(name)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragments.set(name, html)
+        return html
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Фрагмент шаблона, кэшируемый представлением с FragmentCacheMixin
+    Пример: {% fragment_cache 'content' %} ... {% endfragment_cache %}
+    Без fragment_cache в контексте (например, для владельца или модератора) фрагмент отображается заново
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает один аргумент - имя фрагмента")
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]))
@@ -0,0 +1,148 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from users.models import CustomUser
+from .models import Breed, Dog, Pedigree
+from .ancestry import get_ancestry_version_keys
+from .services import DOG_LIST_VERSION_PK, get_dog_from_cache, get_version_key, get_versions
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dogs-tests'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dogs-tests-sessions'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DogCacheInvalidationTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='password')
+        breed = Breed.objects.create(name='Лабрадор')
+        self.dog = Dog.objects.create(name='Рекс', breed=breed, owner=owner, birth_date=datetime.date(2020, 1, 1))
+
+    def test_delete_in_atomic_invalidates_cached_dog(self):
+        pk = self.dog.pk
+        self.assertEqual(get_dog_from_cache(pk=pk).pk, pk)
+
+        # Как в админке: удаление внутри внешней транзакции, версия увеличивается после фиксации
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.dog.delete()
+
+        self.assertIsNone(get_dog_from_cache(pk=pk))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImportDogsTests(TestCase):
+    def setUp(self):
+        CustomUser.objects.create_user(username='owner', email='owner@example.com', password='password')
+        Breed.objects.create(name='Лабрадор')
+
+    def import_rows(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as source:
+            for row in rows:
+                source.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.addCleanup(os.remove, source.name)
+        stderr = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_dogs', source.name, stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_null_and_numeric_values(self):
+        version_key = get_version_key(Dog, DOG_LIST_VERSION_PK)
+        version = get_versions([version_key])[0]
+        errors = self.import_rows([
+            {
+                'name': 'Рекс', 'breed': 'Лабрадор', 'owner': 'owner', 'birth_date': '2020-01-01',
+                'registration_number': 123, 'issued_by': 'РКФ', 'issue_date': '2020-02-01',
+                'father': None, 'mother': None, 'description': None,
+            },
+            {
+                'name': 'Бим', 'breed': 'Лабрадор', 'owner': 'owner', 'birth_date': '2021-01-01',
+                'registration_number': 456, 'issued_by': 'РКФ', 'issue_date': '2021-02-01',
+                'father': 123, 'mother': None, 'is_active': None,
+            },
+        ])
+
+        self.assertEqual(errors, '')
+        child = Pedigree.objects.select_related('father').get(registration_number='456')
+        self.assertEqual(child.father.name, 'Рекс')
+        self.assertIsNone(child.mother_id)
+        self.assertTrue(child.dog.is_active)
+        # Собаки созданы bulk_create без сигналов: версия списка увеличивается явно
+        self.assertNotEqual(get_versions([version_key])[0], version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FragmentInvalidationTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='password')
+        breed = Breed.objects.create(name='Лабрадор')
+        self.parent, self.child, self.other = (
+            Dog.objects.create(name=name, breed=breed, owner=self.owner, birth_date=datetime.date(2020, 1, 1))
+            for name in ('Отец', 'Сын', 'Чужой')
+        )
+        Pedigree.objects.create(
+            dog=self.child, father=self.parent, registration_number='1', issued_by='РКФ',
+            issue_date=datetime.date(2020, 2, 1),
+        )
+
+    def get_version(self, key):
+        return get_versions([key])[0]
+
+    def test_user_saves_bump_list_only_for_owner_rename(self):
+        list_key = get_version_key(Dog, DOG_LIST_VERSION_PK)
+        version = self.get_version(list_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(username='guest', email='guest@example.com', password='password')
+            self.owner.first_name = 'Иван'
+            self.owner.save()
+        self.assertEqual(self.get_version(list_key), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.username = 'renamed'
+            self.owner.save()
+        self.assertNotEqual(self.get_version(list_key), version)
+
+    def test_ancestor_rename_invalidates_only_descendants(self):
+        child_key, other_key = (get_ancestry_version_keys(dog.pk)[1] for dog in (self.child, self.other))
+        child_version, other_version = self.get_version(child_key), self.get_version(other_key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parent.name = 'Новый отец'
+            self.parent.save()
+
+        self.assertNotEqual(self.get_version(child_key), child_version)
+        self.assertEqual(self.get_version(other_key), other_version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DogPermissionTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='password')
+        breed = Breed.objects.create(name='Лабрадор')
+        self.dog = Dog.objects.create(name='Рекс', breed=breed, owner=owner, birth_date=datetime.date(2020, 1, 1))
+
+    def test_moderators_group_does_not_grant_dog_rights(self):
+        user = CustomUser.objects.create_user(username='reviewer', email='reviewer@example.com', password='password')
+        user.groups.add(Group.objects.create(name='moderators'))
+        self.client.force_login(user)
+
+        self.assertEqual(self.client.get(reverse('dog_update', args=[self.dog.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('review-moderation-list')).status_code, 200)
+
+    def test_moderator_role_grants_dog_rights(self):
+        user = CustomUser.objects.create_user(
+            username='moderator', email='moderator@example.com', password='password', role='moderator'
+        )
+        self.client.force_login(user)
+
+        self.assertEqual(self.client.get(reverse('dog_update', args=[self.dog.pk])).status_code, 200)
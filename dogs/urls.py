@@ -1,22 +1,32 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
+    AsyncDogDetailView,
+    AsyncDogListView,
     DogListView,
     DogDetailView,
     DogCreateView,
     DogUpdateView,
     DogDeleteView,
     ClearDogCacheView,
+    ClearDogsCacheView,
     ClearAllCacheView,
     ToggleDogStatusView,
 )
 
 urlpatterns = [
-    path('', DogListView.as_view(), name='dog_list'),
-    path('dogs/<slug:slug>/', DogDetailView.as_view(), name='dog_detail'),
+    # Под ASGI список и карточка собаки обслуживаются асинхронными представлениями
+    path('', (AsyncDogListView if settings.ASYNC_VIEWS else DogListView).as_view(), name='dog_list'),
+    path(
+        'dogs/<slug:slug>/',
+        (AsyncDogDetailView if settings.ASYNC_VIEWS else DogDetailView).as_view(),
+        name='dog_detail',
+    ),
     path('dog/create/', DogCreateView.as_view(), name='dog_create'),
     path('dog/<int:pk>/update/', DogUpdateView.as_view(), name='dog_update'),
     path('dog/<int:pk>/delete/', DogDeleteView.as_view(), name='dog_delete'),
     path('clear-dog-cache/<int:pk>/', ClearDogCacheView.as_view(), name='clear_dog_cache'),
+    path('clear-dogs-cache/', ClearDogsCacheView.as_view(), name='clear_dogs_cache'),
     path('clear-all-cache/', ClearAllCacheView.as_view(), name='clear_all_cache'),
     path('dog/<int:pk>/toggle-status/', ToggleDogStatusView.as_view(), name='toggle_dog_status'),
 ]
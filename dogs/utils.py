@@ -1,20 +1,14 @@
-from django.core.mail import send_mail
-from django.conf import settings
+from users.authorization import get_access
+from users.models import OutgoingEmail
 
 
 def send_email(subject, message, recipient_list):
     """
-    Отправляет электронное письмо
+    Ставит электронное письмо в очередь на отправку
     """
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=recipient_list,
-        fail_silently=False,
-    )
+    OutgoingEmail.enqueue(subject, message, recipient_list)
 
 
 # Проверяем роль пользователя
 def is_moderator(user):
-    return user.role in ['admin', 'moderator']
+    return get_access(user).is_moderator
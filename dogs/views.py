@@ -2,28 +2,112 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, Http404
+from django.conf import settings
+from django.core.cache import cache
 from django.forms import inlineformset_factory
+from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Dog, Pedigree
+from .models import Breed, Dog, Pedigree
 from .forms import DogForm, PedigreeForm
-from .services import get_dog_from_cache, clear_dog_cache, clear_all_cache
-from .utils import send_email
+from .services import (
+    DOG_LIST_VERSION_PK, get_dog_from_cache, clear_dog_cache, clear_dogs_cache, clear_all_cache, filter_dogs,
+    get_version_key,
+)
+from .ancestry import AncestryGraph, PedigreeCycleError, get_ancestry_version_keys
+from .fragments import FragmentCacheMixin, get_role_bucket
+from .counters import increment_dog_views
+from .pagination import KeysetPaginator, InvalidCursor
+from .search import get_search_backend
+from .utils import is_moderator, send_email
 from django import forms
+from users.async_utils import AsyncViewMixin, run_blocking
+from users.uploads import NormalizedImageField
 
 
-class DogListView(ListView):
+class DogListView(FragmentCacheMixin, ListView):
     """
     Отображение списка собак с возможностью:
     Поиска по имени,
     Поиска по породе,
     Сортировки по имени, породе или дате рождения,
     Переключения между активными и деактивированными собаками.
+    Поддерживает курсорную пагинацию (DOG_LIST_PAGINATION = 'keyset') и размер страницы из параметра page_size.
+    Для анонимных пользователей и пользователей без собак список берется из кэша фрагментов.
     """
     model = Dog
     template_name = 'dogs/dog_list.html'
     context_object_name = 'dogs'
-    paginate_by = 1
+    paginate_by = settings.DOG_LIST_PAGE_SIZE
+
+    fragment_view_name = 'dog_list'
+    fragment_params = ('search', 'breed_search', 'sort_by', 'page', 'cursor', 'page_size')
+    fragment_param_defaults = {'sort_by': 'name', 'page': '1', 'page_size': str(settings.DOG_LIST_PAGE_SIZE)}
+
+    # Поля модели, по которым выполняется сортировка и курсорная пагинация
+    sort_fields = {
+        'name': 'name',
+        'breed': 'breed_id',
+        'birth_date': 'birth_date',
+    }
+
+    def get_fragment_bucket(self):
+        """
+        Владельцу собак в списке видны кнопки редактирования, поэтому список для него не кэшируется
+        """
+        bucket = super().get_fragment_bucket()
+        if bucket == 'user' and self.request.user.dogs.exists():
+            return 'owner'
+        return bucket
+
+    def get_fragment_version_keys(self):
+        return [get_version_key(Dog, DOG_LIST_VERSION_PK)]
+
+    def get(self, request, *args, **kwargs):
+        self.fragment_cache = self.get_fragment_cache()
+        if self.has_cached_fragments():
+            return self.render_cached_fragments()
+        return super().get(request, *args, **kwargs)
+
+    def render_cached_fragments(self):
+        """
+        Все фрагменты есть в кэше: поиск и запросы к базе данных не выполняются
+        """
+        self.object_list = Dog.objects.none()
+        return self.render_to_response({'view': self, 'fragment_cache': self.fragment_cache})
+
+    def get_sort_field(self):
+        sort_by = self.request.GET.get('sort_by', 'name')
+        return self.sort_fields.get(sort_by, self.sort_fields['name'])
+
+    def get_paginate_by(self, queryset):
+        """
+        Размер страницы из параметра page_size, ограниченный DOG_LIST_MAX_PAGE_SIZE
+        """
+        try:
+            page_size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            return self.paginate_by
+        return min(max(page_size, 1), settings.DOG_LIST_MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Курсорная пагинация без OFFSET и COUNT(*) на каждый запрос
+        """
+        if settings.DOG_LIST_PAGINATION != 'keyset':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(
+            queryset,
+            self.get_sort_field(),
+            page_size,
+            count_timeout=settings.DOG_LIST_COUNT_CACHE_TIMEOUT,
+        )
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Неверный курсор пагинации.")
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def get_queryset(self):
         status = self.request.GET.get('status', 'active')  # По умолчанию показываем активных собак
@@ -33,7 +117,7 @@ class DogListView(ListView):
 
         queryset = Dog.objects.all()
 
-        if self.request.user.role in ['admin', 'moderator']:
+        if is_moderator(self.request.user):
             if status == 'inactive':
                 queryset = queryset.filter(is_active=False)
             else:
@@ -41,16 +125,14 @@ class DogListView(ListView):
         else:
             queryset = queryset.filter(is_active=True)
 
-        if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-
-        if breed_search:
-            queryset = queryset.filter(breed__name__icontains=breed_search)
+        # Поиск выполняет поисковый бэкенд, порядок и пагинация остаются за базой данных
+        if search_query or breed_search:
+            queryset = get_search_backend().filter_queryset(queryset, search_query, breed_search)
 
-        if sort_by in ['name', 'breed', 'birth_date']:
-            queryset = queryset.order_by(sort_by)
+        if sort_by in self.sort_fields:
+            queryset = queryset.order_by(self.sort_fields[sort_by], 'pk')
 
-        queryset = queryset.select_related('owner')
+        queryset = queryset.select_related('owner', 'breed')
 
         return queryset
 
@@ -58,24 +140,61 @@ class DogListView(ListView):
         context = super().get_context_data(**kwargs)
 
         context['current_status'] = self.request.GET.get('status', 'active')
-        context['allowed_roles'] = ['admin', 'moderator']
 
         context['breed_search'] = self.request.GET.get('breed_search', '')
         context['search_query'] = self.request.GET.get('search', '')
         context['sort_by'] = self.request.GET.get('sort_by', 'name')
 
+        # Параметры фильтрации и сортировки для ссылок пагинации
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        query.pop('cursor', None)
+        context['pagination_query'] = query.urlencode()
+        context['is_keyset_pagination'] = settings.DOG_LIST_PAGINATION == 'keyset'
+
         return context
 
 
-class DogDetailView(DetailView):
+class DogDetailView(FragmentCacheMixin, DetailView):
     """
     Отображает детальную информацию о собаке с использованием кэширования.
-    Увеличивает счетчик просмотров, если пользователь не является владельцем собаки.
+    Увеличивает буферизованный счетчик просмотров, если пользователь не является владельцем собаки.
+    Карточка (кроме счетчика просмотров) для всех, кроме владельца и модераторов, берется из кэша фрагментов.
     """
     model = Dog
     template_name = 'dogs/dog_detail.html'
     context_object_name = 'dog'
 
+    fragment_view_name = 'dog_detail'
+    fragment_names = ('header', 'body')
+
+    def get_fragment_bucket(self):
+        return get_role_bucket(self.request.user, self.object.owner_id)
+
+    def get_fragment_version_keys(self):
+        """
+        Карточка зависит от собаки, породы, владельца и предков собаки (родословные, клички и slug предков)
+        """
+        dog = self.object
+        return [
+            get_version_key(Dog, dog.pk),
+            get_version_key(Breed, dog.breed_id),
+            get_version_key(get_user_model(), dog.owner_id),
+            *get_ancestry_version_keys(dog.pk),
+        ]
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if isinstance(self.object, HttpResponse):
+            # Неактивная собака: get_object вернул страницу "собака не найдена"
+            return self.object
+        self.fragment_cache = self.get_fragment_cache()
+        return self.render_object()
+
+    def render_object(self):
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
     def get_object(self, queryset=None):
         """
         Получает объект собаки из кэша или базы данных.
@@ -96,16 +215,63 @@ class DogDetailView(DetailView):
             elif pk:
                 dog = get_object_or_404(Dog, pk=pk)
 
-        if not dog.is_active and self.request.user.role not in ['admin', 'moderator']:
+        if not dog.is_active and not is_moderator(self.request.user):
             return render(self.request, 'dogs/dog_not_found.html')
 
         # Увеличиваем счетчик просмотров, если пользователь не владелец
+        # Просмотры накапливаются в буфере и периодически записываются в базу данных
         if self.request.user != dog.owner:
-            dog.views_count += 1
-            dog.save()
+            dog.views_count += increment_dog_views(dog.pk)
 
         return dog
 
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет дерево предков и коэффициент инбридинга, если карточки нет в кэше
+        """
+        context = super().get_context_data(**kwargs)
+        if self.has_cached_fragments():
+            return context
+        ancestry = AncestryGraph.for_dog(self.object.pk)
+        context['pedigree_tree'] = ancestry.tree()
+        try:
+            context['inbreeding_coefficient'] = ancestry.inbreeding_coefficient() * 100
+        except PedigreeCycleError:
+            context['inbreeding_coefficient'] = None
+        return context
+
+
+class AsyncDogListView(AsyncViewMixin, DogListView):
+    """
+    Асинхронный вариант DogListView для ASGI (ASYNC_VIEWS)
+    Фрагменты читаются асинхронными методами кэша, поиск, запросы и отрисовка выполняются в пуле run_blocking.
+    """
+
+    async def aget_fragment_bucket(self):
+        bucket = get_role_bucket(self.request.user)
+        if bucket == 'user' and await run_blocking(self.request.user.dogs.exists):
+            return 'owner'
+        return bucket
+
+    async def get(self, request, *args, **kwargs):
+        self.fragment_cache = await self.aget_fragment_cache()
+        if self.has_cached_fragments():
+            return await self.run_and_render(self.render_cached_fragments)
+        return await self.run_and_render(ListView.get, self, request, *args, **kwargs)
+
+
+class AsyncDogDetailView(AsyncViewMixin, DogDetailView):
+    """
+    Асинхронный вариант DogDetailView для ASGI (ASYNC_VIEWS)
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await run_blocking(self.get_object)
+        if isinstance(self.object, HttpResponse):
+            return self.object
+        self.fragment_cache = await self.aget_fragment_cache()
+        return await self.run_and_render(self.render_object)
+
 
 class DogCreateView(LoginRequiredMixin, CreateView):
     """
@@ -161,6 +327,7 @@ class DogFullForm(forms.ModelForm):
     class Meta:
         model = Dog
         fields = '__all__'
+        field_classes = {'photo': NormalizedImageField}
 
 
 class DogLimitedForm(forms.ModelForm):
@@ -171,6 +338,7 @@ class DogLimitedForm(forms.ModelForm):
     class Meta:
         model = Dog
         exclude = ('is_active', 'owner', 'views_count')
+        field_classes = {'photo': NormalizedImageField}
 
 
 class DogUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
@@ -232,7 +400,7 @@ class DogUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         user = self.request.user
 
         return (
-            dog.owner == user or user.is_superuser or getattr(user, 'role', None) in ['admin', 'moderator']
+            dog.owner == user or user.is_superuser or is_moderator(user)
         )
 
 
@@ -248,7 +416,7 @@ class DogDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         dog = self.get_object()
         return (
-            dog.owner == self.request.user or self.request.user.role in ['admin', 'moderator']
+            dog.owner == self.request.user or is_moderator(self.request.user)
         )
 
     def delete(self, request, *args, **kwargs):
@@ -256,24 +424,60 @@ class DogDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
-class ClearDogCacheView(View):
+class ClearDogCacheView(LoginRequiredMixin, UserPassesTestMixin, View):
     """
     Очищает кэш для конкретной собаки
     """
 
+    def test_func(self):
+        return self.request.user.is_staff
+
     def get(self, request, pk):
-        clear_dog_cache(pk)
+        clear_dog_cache(pk=pk)
         return JsonResponse({'message': f'Кэш для собаки с ID {pk} очищен.'})
 
 
-class ClearAllCacheView(View):
+class ClearDogsCacheView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Очищает кэш для группы собак
+    Параметры: ids (список id через запятую), owner (id владельца), breed (id породы)
+    """
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        try:
+            dog_ids = [int(dog_id) for dog_id in request.GET.get('ids', '').split(',') if dog_id]
+            owner_id = int(request.GET['owner']) if request.GET.get('owner') else None
+            breed_id = int(request.GET['breed']) if request.GET.get('breed') else None
+        except ValueError:
+            return JsonResponse({'message': 'Параметры ids, owner и breed должны быть числами.'}, status=400)
+
+        if not dog_ids and not owner_id and not breed_id:
+            return JsonResponse({'message': 'Укажите ids, owner или breed.'}, status=400)
+
+        count = clear_dogs_cache(filter_dogs(dog_ids, owner_id, breed_id))
+        return JsonResponse({'message': f'Кэш очищен для {count} собак.', 'count': count})
+
+
+class ClearAllCacheView(LoginRequiredMixin, UserPassesTestMixin, View):
     """
-    Очищает весь кэш
+    Очищает весь кэш собак
+    Доступ разрешен только сотрудникам, не чаще одного раза в DOG_CACHE_CLEAR_RATE_LIMIT секунд
     """
 
+    def test_func(self):
+        return self.request.user.is_staff
+
     def get(self, request):
+        if not cache.add('dog_cache_clear_throttle', request.user.pk, timeout=settings.DOG_CACHE_CLEAR_RATE_LIMIT):
+            return JsonResponse(
+                {'message': 'Кэш собак уже очищался недавно. Повторите попытку позже.'},
+                status=429,
+            )
         clear_all_cache()
-        return JsonResponse({'message': 'Весь кэш очищен.'})
+        return JsonResponse({'message': 'Кэш собак очищен.'})
 
 
 class ToggleDogStatusView(LoginRequiredMixin, UserPassesTestMixin, View):
@@ -283,7 +487,7 @@ class ToggleDogStatusView(LoginRequiredMixin, UserPassesTestMixin, View):
     """
 
     def test_func(self):
-        return self.request.user.role in ['admin', 'moderator']
+        return is_moderator(self.request.user)
 
     def get(self, request, pk):
         # Получаем объект собаки по ID
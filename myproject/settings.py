@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'users.middleware.ReplicaRoutingMiddleware',
+    'users.middleware.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,6 +63,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.authorization',
             ],
         },
     },
@@ -77,12 +80,36 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT', '1433'),
+        # Постоянные соединения: соединение используется повторно в течение DB_CONN_MAX_AGE секунд
+        # вместо нового входа в SQL Server на каждый запрос и проверяется перед повторным использованием
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
         'OPTIONS': {
             'driver': 'ODBC Driver 17 for SQL Server',
+            'connection_timeout': int(os.getenv('DB_CONNECTION_TIMEOUT', '5')),
+            'connection_retries': int(os.getenv('DB_CONNECTION_RETRIES', '3')),
         },
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2 (база и учетные данные те же, что у основной)
+DB_REPLICAS = []
+for number, replica_host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host.strip(),
+        'OPTIONS': {**DATABASES['default']['OPTIONS'], 'extra_params': 'ApplicationIntent=ReadOnly'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['users.db.ReplicaRouter']
+# Сколько секунд после записи пользователь и измененные объекты читаются из основной базы (отставание реплик)
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+
+# Пул соединений диспетчера драйверов ODBC (pyodbc.pooling, см. users/db.py):
+# закрытые соединения возвращаются в пул и не требуют нового входа в SQL Server
+DB_ODBC_POOLING = os.getenv('DB_ODBC_POOLING', 'true').lower() == 'true'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -153,12 +180,25 @@ CACHES = {
             'SOCKET_CONNECT_TIMEOUT': 5,
             'SOCKET_TIMEOUT': 5,
         },
-    }
+    },
+    # Отдельная база Redis для сессий: очистка кэша собак и данных не затрагивает сессии
+    'sessions': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/2',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 5,
+            'SOCKET_TIMEOUT': 5,
+        },
+    },
 }
 
-# Настройки сессий
-SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
-SESSION_CACHE_ALIAS = 'default'
+# Настройки сессий: Redis с постоянной копией в базе данных (см. users/sessions.py)
+SESSION_ENGINE = 'users.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Сообщения хранятся в сессии в компактном виде
+MESSAGE_STORAGE = 'users.sessions.CompactSessionStorage'
 
 # Время жизни кэша
 CACHE_MIDDLEWARE_SECONDS = 600
@@ -170,3 +210,84 @@ AUTH_GROUPS = {
     'moderators': ['can_view_users', 'can_add_review'],
     'admins': ['all']
 }
+
+# Время хранения прав пользователя (роль, группы, права) в кэше, сбрасываются при их изменении
+AUTHORIZATION_CACHE_TIMEOUT = int(os.getenv('AUTHORIZATION_CACHE_TIMEOUT', '3600'))
+
+# Интервал (в секундах) записи буферизованных просмотров собак в базу данных
+DOG_VIEWS_FLUSH_INTERVAL = int(os.getenv('DOG_VIEWS_FLUSH_INTERVAL', '60'))
+
+# Очередь исходящих писем (команда send_queued_emails)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY', '60'))
+# Сколько секунд письмо считается отправляемым одним обработчиком, после чего его может забрать другой
+EMAIL_OUTBOX_CLAIM_TIMEOUT = int(os.getenv('EMAIL_OUTBOX_CLAIM_TIMEOUT', '600'))
+
+# Пагинация списка собак: 'keyset' (курсорная) или 'offset' (постраничная)
+DOG_LIST_PAGINATION = os.getenv('DOG_LIST_PAGINATION', 'keyset')
+DOG_LIST_PAGE_SIZE = int(os.getenv('DOG_LIST_PAGE_SIZE', '20'))
+DOG_LIST_MAX_PAGE_SIZE = 100
+# Время кэширования общего количества собак в списке (0 - не считать количество)
+DOG_LIST_COUNT_CACHE_TIMEOUT = int(os.getenv('DOG_LIST_COUNT_CACHE_TIMEOUT', '300'))
+
+# Размер страницы отзывов на странице пользователя и в очереди модерации
+REVIEW_PAGE_SIZE = int(os.getenv('REVIEW_PAGE_SIZE', '20'))
+
+# Поиск по списку собак: NgramSearchBackend (индекс в памяти),
+# SqlServerFullTextSearchBackend (полнотекстовый поиск SQL Server) или DatabaseSearchBackend (LIKE)
+DOG_SEARCH_BACKEND = os.getenv('DOG_SEARCH_BACKEND', 'dogs.search.NgramSearchBackend')
+DOG_SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'var', 'dog_search_index.pickle')
+# Изменения индекса NgramSearchBackend в кэше: время хранения, сколько изменений процесс догоняет
+# вместо загрузки снимка, как долго ждет еще не записанное изменение и как часто сохраняет снимок на диск
+DOG_SEARCH_CHANGE_TIMEOUT = 60 * 60 * 24
+DOG_SEARCH_MAX_CATCHUP = 1000
+DOG_SEARCH_CHANGE_WAIT = 5
+DOG_SEARCH_SNAPSHOT_INTERVAL = 500
+
+# Минимальный интервал (в секундах) между полными очистками кэша собак
+DOG_CACHE_CLEAR_RATE_LIMIT = int(os.getenv('DOG_CACHE_CLEAR_RATE_LIMIT', '60'))
+
+# Время жизни закэшированных фрагментов списка и карточек собак
+DOG_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('DOG_FRAGMENT_CACHE_TIMEOUT', '300'))
+
+# Родословные: количество отображаемых поколений и время кэширования дерева предков
+PEDIGREE_GENERATIONS = 4
+PEDIGREE_CACHE_TIMEOUT = 60 * 60
+
+# Миниатюры фото собак и аватаров: размеры (ширина, высота), качество и число фоновых потоков
+IMAGE_VARIANT_SIZES = {
+    'thumb': (200, 200),
+    'medium': (600, 600),
+}
+IMAGE_VARIANT_QUALITY = 82
+IMAGE_VARIANT_WORKERS = 2
+# False - миниатюры создаются сразу после фиксации транзакции в том же потоке
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'true').lower() == 'true'
+
+# Загрузка изображений: файлы пишутся во временный файл на диске, размер ограничен,
+# изображения больше IMAGE_UPLOAD_MAX_DIMENSION уменьшаются, метаданные EXIF удаляются
+FILE_UPLOAD_HANDLERS = ['users.uploads.LimitedTemporaryFileUploadHandler']
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(15 * 1024 * 1024)))
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+IMAGE_UPLOAD_MAX_DIMENSION = 2048
+IMAGE_UPLOAD_QUALITY = 88
+
+# Асинхронные представления для чтения (список и карточка собаки, профиль, пользователь) при запуске под ASGI
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+# Размер пула потоков для блокирующих запросов к базе данных из асинхронных представлений
+# (одновременно открыто не больше соединений с базой данных)
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', '8'))
+
+# Запись запросов к базе данных, поиск N+1 и бюджеты запросов представлений (users/queries.py)
+QUERY_INSPECTOR = os.getenv('QUERY_INSPECTOR', str(DEBUG)).lower() == 'true'
+# Сколько одинаковых запросов за один запрос считаются N+1
+QUERY_N_PLUS_ONE_THRESHOLD = 5
+# Максимальное число запросов по имени маршрута
+QUERY_BUDGETS = {
+    'dog_list': 10,
+    'dog_detail': 10,
+    'user-list': 6,
+    'user-detail': 6,
+    'review-moderation-list': 6,
+}
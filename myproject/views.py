@@ -1,14 +1,6 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, user_passes_test
-
-
-# Функции проверки ролей
-def is_admin(user):
-    return user.role == 'admin'
-
-
-def is_moderator(user):
-    return user.role in ['admin', 'moderator']
+from users.authorization import is_admin, is_moderator
 
 
 # Представление только для администраторов
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, OutgoingEmail, Review
+from .services import moderate_reviews
 
 
 @admin.register(CustomUser)
@@ -10,3 +11,35 @@ class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {'fields': ('phone_number', 'address', 'date_of_birth', 'avatar')}),
     )
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'sensitive', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'sensitive')
+    search_fields = ('subject', 'recipients')
+
+    def get_exclude(self, request, obj=None):
+        # Текст писем с учетными данными (временные пароли) в админке не показывается
+        if obj is not None and obj.sensitive:
+            return ('message', 'html_message')
+        return super().get_exclude(request, obj)
+
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ('author', 'target_user', 'rating', 'status', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('author', 'target_user')
+    raw_id_fields = ('author', 'target_user')
+    actions = ('approve_selected', 'reject_selected')
+
+    @admin.action(description="Одобрить выбранные отзывы")
+    def approve_selected(self, request, queryset):
+        count = moderate_reviews(queryset.values_list('pk', flat=True), 'approved')
+        self.message_user(request, f"Одобрено отзывов: {count}.")
+
+    @admin.action(description="Отклонить выбранные отзывы")
+    def reject_selected(self, request, queryset):
+        count = moderate_reviews(queryset.values_list('pk', flat=True), 'rejected')
+        self.message_user(request, f"Отклонено отзывов: {count}.")
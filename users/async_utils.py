@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from .authorization import get_access
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    """
+    Ограниченный пул потоков для блокирующих вызовов (ORM через pyodbc, шаблоны) из асинхронных представлений
+    Каждый поток держит свое соединение с базой данных, поэтому размер пула ограничивает и число соединений.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_DB_WORKERS, thread_name_prefix='async-db'
+                )
+    return _executor
+
+
+def call_blocking(func, *args, **kwargs):
+    """
+    Выполняется в потоке пула: соединения закрываются по тем же правилам (CONN_MAX_AGE),
+    что и в начале и в конце обычного запроса
+    """
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Выполняет блокирующую функцию в пуле get_db_executor, не занимая цикл событий
+    """
+    return await sync_to_async(call_blocking, thread_sensitive=False, executor=get_db_executor())(
+        func, *args, **kwargs
+    )
+
+
+def resolve_user(request):
+    """
+    Загружает сессию, пользователя и его права (request.user ленивый и обращается к базе данных),
+    чтобы проверки ролей в цикле событий не выполняли запросов
+    """
+    get_access(request.user)
+    return request.user.is_authenticated
+
+
+def render_response(response):
+    """
+    Отрисовывает TemplateResponse: шаблоны могут обращаться к связанным объектам в базе данных
+    """
+    if not getattr(response, 'is_rendered', True):
+        response.render()
+    return response
+
+
+class AsyncViewMixin:
+    """
+    Основа асинхронных представлений только для чтения
+    Сессия и пользователь загружаются в пуле run_blocking до проверок доступа (LoginRequiredMixin),
+    обработчик get в наследниках - корутина. Синхронные обращения к базе данных из цикла событий
+    запрещены Django, поэтому запросы и отрисовка шаблонов выполняются через run_blocking.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        await run_blocking(resolve_user, request)
+        response = super().dispatch(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        if not getattr(response, 'is_rendered', True):
+            response = await run_blocking(render_response, response)
+        return response
+
+    async def run_and_render(self, func, *args, **kwargs):
+        """
+        Выполняет синхронный обработчик и отрисовывает его ответ за один переход в пул
+        """
+        return await run_blocking(lambda: render_response(func(*args, **kwargs)))
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Роли (поле role): определяют права на собак
+ROLES = ('user', 'moderator', 'admin')
+
+# Группа, участники которой модерируют отзывы наравне с персоналом (на права на собак не влияет)
+REVIEW_MODERATORS_GROUP = 'moderators'
+
+# Поля пользователя, от которых зависят права: при их изменении закэшированные права недействительны
+ACCESS_FIELDS = ('role', 'is_staff', 'is_superuser', 'is_active')
+
+# Право из AUTH_GROUPS, дающее все права приложения
+ALL_PERMISSIONS = 'all'
+
+
+def get_access_key(user_id):
+    return f"authorization:{user_id}"
+
+
+def get_access_fields(user):
+    return [getattr(user, field, None) for field in ACCESS_FIELDS]
+
+
+class Access:
+    """
+    Права пользователя: роль (поле role), группы и права (Django и AUTH_GROUPS)
+    Права на собак зависят только от роли, модерация отзывов - от is_staff и группы moderators
+    """
+
+    def __init__(self, role, is_staff=False, is_superuser=False, groups=(), permissions=()):
+        self.role = role
+        self.is_staff = is_staff
+        self.is_superuser = is_superuser
+        self.groups = frozenset(groups)
+        self.permissions = frozenset(permissions)
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    @property
+    def is_moderator(self):
+        """
+        Администраторы и модераторы: неактивные собаки, изменение и удаление чужих собак
+        """
+        return self.role in ('admin', 'moderator')
+
+    @property
+    def can_moderate_reviews(self):
+        """
+        Модерация отзывов и просмотр персонала: только персонал и группа moderators (роль не учитывается)
+        """
+        return self.is_staff or REVIEW_MODERATORS_GROUP in self.groups
+
+    def in_group(self, name):
+        return name in self.groups
+
+    def has_perm(self, permission):
+        if self.is_superuser or ALL_PERMISSIONS in self.permissions:
+            return True
+        return permission in self.permissions
+
+    def to_dict(self):
+        return {
+            'role': self.role,
+            'is_staff': self.is_staff,
+            'is_superuser': self.is_superuser,
+            'groups': sorted(self.groups),
+            'permissions': sorted(self.permissions),
+        }
+
+
+ANONYMOUS_ACCESS = Access('anonymous')
+
+
+def resolve_access(user):
+    """
+    Загружает права пользователя из базы данных: группы и права Django (запросы выполняются при промахе кэша)
+    """
+    groups = set(user.groups.values_list('name', flat=True))
+    permissions = set(user.get_all_permissions())
+    for name in groups:
+        permissions.update(settings.AUTH_GROUPS.get(name, ()))
+    return Access(
+        user.role if user.role in ROLES else 'user',
+        is_staff=user.is_staff,
+        is_superuser=user.is_superuser,
+        groups=groups,
+        permissions=permissions,
+    )
+
+
+def get_access(user):
+    """
+    Права пользователя: один раз за запрос (хранятся в объекте request.user), между запросами - в кэше
+    Закэшированные права сверяются с полями ACCESS_FIELDS пользователя, поэтому изменение роли
+    видно сразу, даже если оно сделано без сигналов (QuerySet.update).
+    """
+    if not user.is_authenticated:
+        return ANONYMOUS_ACCESS
+    access = getattr(user, '_access', None)
+    if access is not None:
+        return access
+
+    key = get_access_key(user.pk)
+    fields = get_access_fields(user)
+    data = cache.get(key)
+    if data is not None and data['fields'] == fields:
+        access = Access(**data['access'])
+    else:
+        access = resolve_access(user)
+        cache.set(key, {'fields': fields, 'access': access.to_dict()}, timeout=settings.AUTHORIZATION_CACHE_TIMEOUT)
+    user._access = access
+    return access
+
+
+def invalidate_access(user_ids):
+    """
+    Удаляет закэшированные права пользователей после фиксации транзакции
+    """
+    keys = [get_access_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def is_admin(user):
+    return get_access(user).is_admin
+
+
+def is_moderator(user):
+    return get_access(user).is_moderator
+
+
+def can_moderate_reviews(user):
+    return get_access(user).can_moderate_reviews
@@ -0,0 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+from .authorization import get_access
+
+
+def authorization(request):
+    """
+    Права текущего пользователя в шаблонах ({{ access.is_moderator }}), загружаются при первом обращении
+    """
+    return {'access': SimpleLazyObject(lambda: get_access(request.user))}
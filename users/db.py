@@ -0,0 +1,79 @@
+import logging
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger(__name__)
+
+
+def configure_odbc_pooling():
+    """
+    Включает или отключает пул соединений диспетчера драйверов ODBC (DB_ODBC_POOLING)
+    pyodbc читает настройку при первом соединении, поэтому функция вызывается при запуске приложения.
+    """
+    if not any(connection.vendor == 'microsoft' for connection in connections.all()):
+        return
+    try:
+        import pyodbc
+    except ImportError:
+        return
+    pyodbc.pooling = settings.DB_ODBC_POOLING
+    logger.debug("Пул соединений ODBC %s", 'включен' if pyodbc.pooling else 'отключен')
+
+
+# Приложения, данные которых всегда читаются из основной базы (сессия нужна сразу после входа)
+PRIMARY_ONLY_APPS = ('sessions',)
+
+# Читать ли из реплик в текущем запросе: вне запросов (команды, фоновые потоки) чтение идет из основной базы
+_read_from_replicas = ContextVar('read_from_replicas', default=False)
+
+# Была ли запись в основную базу в текущем запросе
+_wrote_to_primary = ContextVar('wrote_to_primary', default=False)
+
+
+def start_request(read_from_replicas):
+    _read_from_replicas.set(read_from_replicas and bool(settings.DB_REPLICAS))
+    _wrote_to_primary.set(False)
+
+
+def finish_request():
+    """
+    Завершает запрос и возвращает True, если в нем была запись в основную базу
+    """
+    wrote = _wrote_to_primary.get()
+    _read_from_replicas.set(False)
+    _wrote_to_primary.set(False)
+    return wrote
+
+
+class ReplicaRouter:
+    """
+    Чтение из реплик (DB_REPLICAS), запись в основную базу
+    Из основной базы читаются: данные внутри транзакций и после записи в том же запросе, сессии,
+    запросы вне HTTP-запросов и все запросы пользователя в течение DB_REPLICA_STICKY_SECONDS после его записи
+    (ReplicaRoutingMiddleware), чтобы он сразу видел свои изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _read_from_replicas.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        if _wrote_to_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаются из той же базы, что и сам объект
+            return instance._state.db
+        return random.choice(settings.DB_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_ONLY_APPS:
+            _wrote_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
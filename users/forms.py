@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm
 from .models import CustomUser, Review
+from .uploads import NormalizedImageField
 
 
 # Форма для регистрации нового пользователя
@@ -55,6 +56,7 @@ class CustomUserUpdateForm(forms.ModelForm):
     class Meta:
         model = CustomUser
         fields = ['username', 'email', 'phone_number', 'address', 'date_of_birth', 'avatar']
+        field_classes = {'avatar': NormalizedImageField}
         widgets = {
             'username': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Имя пользователя'}),
             'email': forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'Email'}),
@@ -0,0 +1,264 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .storage import hash_content, is_blob_name
+
+
+logger = logging.getLogger(__name__)
+
+# Форматы производных изображений: формат Pillow и расширение файла
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+# Служебные ключи списка миниатюр: имя и хеш оригинала, остальные ключи - файлы миниатюр
+VARIANT_METADATA_KEYS = ('source', 'digest')
+
+# Список миниатюр записан (без post_save): аргументы instance и field_name
+image_variants_saved = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Пул потоков для генерации миниатюр вне потока обработки запроса
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants'
+                )
+    return _executor
+
+
+def hash_file(field_file):
+    """
+    SHA-256 содержимого файла, прочитанного по частям
+    """
+    with field_file.storage.open(field_file.name, 'rb') as source:
+        return hash_content(source)
+
+
+def variant_name(name, size, extension, digest):
+    """
+    Предлагаемое имя производного файла рядом с оригиналом: dogs/box_thumb_1a2b3c4d5e6f7a8b.webp
+    ContentAddressedStorage сохраняет файл под именем по хешу, из этого имени берутся только каталог и расширение
+    """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, f"{stem}_{size}_{digest[:16]}.{extension}").replace('\\', '/')
+
+
+def render_variant(image, dimensions, pillow_format):
+    """
+    Уменьшает изображение, сохраняя пропорции, и кодирует его в указанный формат
+    """
+    variant = image.copy()
+    variant.thumbnail(dimensions, Image.LANCZOS)
+    if pillow_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', variant.size, 'white')
+        background.paste(variant, mask=variant.convert('RGBA').getchannel('A'))
+        variant = background
+    buffer = io.BytesIO()
+    variant.save(buffer, format=pillow_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(field_file, recorded=None):
+    """
+    Создает миниатюры всех размеров в форматах JPEG и WebP
+    recorded - уже записанный список миниатюр: если он создан из оригинала с тем же хешем,
+    существующие миниатюры используются повторно, и изображение декодируется только для недостающих.
+    Возвращает словарь {'source': имя оригинала, 'digest': хеш оригинала, 'thumb.webp': имя файла, ...}
+    """
+    storage = field_file.storage
+    digest = hash_file(field_file)
+    variants = {'source': field_file.name, 'digest': digest}
+    reusable = recorded if recorded and recorded.get('digest') == digest else {}
+    missing = {}
+
+    for size in settings.IMAGE_VARIANT_SIZES:
+        for image_format, (pillow_format, extension) in VARIANT_FORMATS.items():
+            key = f"{size}.{image_format}"
+            if key in reusable and storage.exists(reusable[key]):
+                variants[key] = reusable[key]
+            else:
+                variants[key] = variant_name(field_file.name, size, extension, digest)
+                missing[key] = (size, pillow_format)
+
+    if not missing:
+        return variants
+
+    with storage.open(field_file.name, 'rb') as source:
+        image = Image.open(source)
+        # JPEG декодируется сразу в уменьшенном масштабе, достаточном для самой большой миниатюры
+        largest = max(settings.IMAGE_VARIANT_SIZES.values())
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    for key, (size, pillow_format) in missing.items():
+        content = render_variant(image, settings.IMAGE_VARIANT_SIZES[size], pillow_format)
+        variants[key] = storage.save(variants[key], ContentFile(content))
+    return variants
+
+
+def get_variant_files(variants):
+    return {name for key, name in (variants or {}).items() if key not in VARIANT_METADATA_KEYS}
+
+
+def save_image_variants(instance, field_name, variants):
+    """
+    Записывает список миниатюр через QuerySet.update(): post_save не отправляется, поэтому поисковый индекс
+    и кэши собак не сбрасываются. Новые миниатюры получают ссылки, ссылки на прежние освобождаются.
+    Возвращает False, если изображение уже заменили другим (его миниатюры создаст отдельная задача).
+    """
+    from .services import acquire_files, release_files
+
+    model = type(instance)
+    variants_field = model.image_variant_fields[field_name]
+    name = getattr(instance, field_name).name
+    image_filter = Q(**{field_name: name}) if name else Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+    previous = get_variant_files(getattr(instance, variants_field))
+    current = get_variant_files(variants)
+
+    with transaction.atomic():
+        if not model._default_manager.filter(image_filter, pk=instance.pk).update(**{variants_field: variants}):
+            return False
+        acquire_files(current - previous)
+        release_files(previous - current)
+
+    # Файлы со старыми именами (не по хешу) счетчиков ссылок не имеют и принадлежат только этой записи
+    legacy = {name for name in previous - current if not is_blob_name(name)}
+    if legacy:
+        storage = getattr(instance, field_name).storage
+
+        def delete_legacy():
+            for name in legacy:
+                storage.delete(name)
+        transaction.on_commit(delete_legacy)
+
+    setattr(instance, variants_field, variants)
+    instance._stored_files = instance.get_stored_files()
+    image_variants_saved.send(sender=model, instance=instance, field_name=field_name)
+    return True
+
+
+def process_image_variants(model, pk, field_name):
+    """
+    Генерирует миниатюры для поля изображения и сохраняет их список в модели
+    """
+    try:
+        instance = model._default_manager.filter(pk=pk).first()
+        if instance is None:
+            return
+        field_file = getattr(instance, field_name)
+        recorded = getattr(instance, model.image_variant_fields[field_name])
+        # Миниатюры записываются и получают ссылки в одной транзакции (см. ContentAddressedStorage)
+        with transaction.atomic():
+            variants = generate_variants(field_file, recorded) if field_file else {}
+            save_image_variants(instance, field_name, variants)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning(f"Не удалось создать миниатюры для {model.__name__} {pk}.{field_name}: {exc}")
+
+
+def process_in_background(model, pk, field_name):
+    """
+    Задача пула потоков: у каждого потока свое соединение с базой данных, его нужно закрыть
+    """
+    try:
+        process_image_variants(model, pk, field_name)
+    except Exception:
+        logger.exception(f"Ошибка при создании миниатюр для {model.__name__} {pk}.{field_name}")
+    finally:
+        close_old_connections()
+
+
+def schedule_image_variants(instance, field_name):
+    """
+    Ставит генерацию миниатюр в очередь после фиксации транзакции, если изображение изменилось
+    """
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, instance.image_variant_fields[field_name]) or {}
+    if field_file and variants.get('source') == field_file.name:
+        return
+    if not field_file and not variants:
+        return
+
+    model, pk = type(instance), instance.pk
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(process_in_background, model, pk, field_name))
+    else:
+        transaction.on_commit(lambda: process_image_variants(model, pk, field_name))
+
+
+class ImageVariants:
+    """
+    Доступ к миниатюрам изображения из шаблонов
+    Пока миниатюры не созданы, возвращается адрес оригинала
+    """
+
+    def __init__(self, field_file, variants):
+        self.field_file = field_file
+        self.variants = variants or {}
+
+    def __bool__(self):
+        return bool(self.field_file)
+
+    def is_ready(self):
+        return bool(self.field_file) and self.variants.get('source') == self.field_file.name
+
+    def url(self, size, image_format='jpeg'):
+        if not self.field_file:
+            return None
+        if self.is_ready() and f"{size}.{image_format}" in self.variants:
+            return self.field_file.storage.url(self.variants[f"{size}.{image_format}"])
+        return self.field_file.url if image_format == 'jpeg' else None
+
+
+class ImageVariantsMixin:
+    """
+    Примесь для моделей с полями изображений
+    image_variant_fields: {поле изображения: JSON-поле со списком миниатюр}
+    """
+    image_variant_fields = {}
+
+    def save(self, *args, **kwargs):
+        """
+        Сохранение в транзакции: блокировка повторно используемого файла (ContentAddressedStorage)
+        держится, пока post_save не увеличит счетчик ссылок на него
+        """
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def get_image_variants(self, field_name):
+        return ImageVariants(getattr(self, field_name), getattr(self, self.image_variant_fields[field_name]))
+
+    def get_stored_files(self):
+        """
+        Имена всех файлов, на которые ссылается запись: изображения и их миниатюры
+        Возвращает None, если поля файлов не загружены (отложены через only/defer)
+        """
+        deferred = self.get_deferred_fields()
+        names = set()
+        for field_name, variants_field in self.image_variant_fields.items():
+            if field_name in deferred or variants_field in deferred:
+                return None
+            field_file = getattr(self, field_name)
+            if field_file:
+                names.add(field_file.name)
+            names.update(get_variant_files(getattr(self, variants_field)))
+        return names
@@ -0,0 +1,69 @@
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure per-request database connection overhead: a new connection per request '
+        '(CONN_MAX_AGE=0) vs persistent connections with health checks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per mode')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to measure')
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE for the persistent mode')
+
+    def handle(self, *args, **kwargs):
+        connection = connections[kwargs['database']]
+        self.stdout.write(
+            f"Database '{kwargs['database']}' ({connection.vendor}), configured "
+            f"CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']}, "
+            f"CONN_HEALTH_CHECKS={connection.settings_dict['CONN_HEALTH_CHECKS']}"
+        )
+        self.report_odbc_pooling(connection)
+
+        original = {
+            key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')
+        }
+        modes = (
+            ('new connection per request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent', {'CONN_MAX_AGE': kwargs['max_age'], 'CONN_HEALTH_CHECKS': False}),
+            ('persistent + health checks', {'CONN_MAX_AGE': kwargs['max_age'], 'CONN_HEALTH_CHECKS': True}),
+        )
+        try:
+            for label, options in modes:
+                connection.close()
+                connection.settings_dict.update(options)
+                elapsed, opened = self.simulate_requests(connection, kwargs['requests'])
+                self.stdout.write(
+                    f"{label:30} {elapsed / kwargs['requests'] * 1000:8.3f} ms per request, "
+                    f"{opened} connections opened"
+                )
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+    def simulate_requests(self, connection, count):
+        """
+        Цикл запроса как в обработчике Django: request_started и request_finished закрывают
+        устаревшие соединения (close_old_connections), между ними выполняется один запрос
+        """
+        opened = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            request_started.send(sender=self.__class__)
+            if connection.connection is None:
+                opened += 1
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            request_finished.send(sender=self.__class__)
+        return time.perf_counter() - started, opened
+
+    def report_odbc_pooling(self, connection):
+        if connection.vendor != 'microsoft':
+            return
+        import pyodbc
+        self.stdout.write(f"ODBC driver manager pooling: {'on' if pyodbc.pooling else 'off'} (DB_ODBC_POOLING)")
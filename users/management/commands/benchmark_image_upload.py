@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from users.uploads import normalize_image
+
+
+def decode_full(path):
+    """
+    Прежнее поведение: изображение полностью декодируется в исходном разрешении
+    """
+    with Image.open(path) as image:
+        image.load()
+        image.copy().save(tempfile.TemporaryFile(), format=image.format)
+
+
+def decode_normalized(path):
+    """
+    Новый конвейер загрузки: проверка заголовка, draft/reduce, удаление EXIF
+    """
+    upload = TemporaryUploadedFile(os.path.basename(path), 'image/jpeg', os.path.getsize(path), None)
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(64 * 1024), b''):
+            upload.write(chunk)
+    upload.seek(0)
+    normalize_image(upload)
+    upload.close()
+
+
+def measure(func, path, queue):
+    """
+    Выполняется в дочернем процессе: пиковая память процесса (ru_maxrss) не сбрасывается,
+    поэтому каждый замер запускается в отдельном процессе
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - started
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before, elapsed))
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory and time of processing one uploaded image: full decode vs normalize_image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, help='Image to process (a synthetic JPEG is generated by default)')
+        parser.add_argument('--width', type=int, default=6000, help='Width of the generated JPEG')
+        parser.add_argument('--height', type=int, default=4000, help='Height of the generated JPEG')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per mode, the maximum peak is reported')
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        generated = None
+        if not path:
+            generated = path = self.generate(kwargs['width'], kwargs['height'])
+        elif not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        try:
+            context = multiprocessing.get_context('fork')
+            self.stdout.write(f"Image: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+            self.stdout.write(f"{'mode':<12}{'peak MB':>10}{'time ms':>10}")
+            for mode, func in (('full', decode_full), ('normalized', decode_normalized)):
+                results = []
+                for _ in range(kwargs['repeat']):
+                    queue = context.Queue()
+                    process = context.Process(target=measure, args=(func, path, queue))
+                    process.start()
+                    results.append(queue.get())
+                    process.join()
+                peak = max(result[0] for result in results) / 1024
+                elapsed = min(result[1] for result in results) * 1000
+                self.stdout.write(f"{mode:<12}{peak:>10.1f}{elapsed:>10.1f}")
+        finally:
+            if generated:
+                os.remove(generated)
+
+    def generate(self, width, height):
+        """
+        Создает JPEG с шумом, который плохо сжимается, как настоящая фотография
+        """
+        handle, path = tempfile.mkstemp(suffix='.jpg')
+        os.close(handle)
+        noise = Image.effect_noise((width // 4, height // 4), 64).resize((width, height))
+        Image.merge('RGB', (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise)).save(path, quality=90)
+        return path
@@ -0,0 +1,115 @@
+import time
+from types import SimpleNamespace
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.messages import constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.session import SessionStorage
+from django.contrib.sessions.backends.cache import SessionStore as CacheStore
+from django.core.management.base import BaseCommand
+from users.sessions import CompactSessionStorage, SessionStore
+
+
+def measure(func, repeat):
+    """
+    Процессорное время одной операции в миллисекундах (time.process_time, без ожидания сети)
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - started) / repeat * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure CPU cost of login (password check) and of loading/saving sessions: '
+        'cache-only engine vs users.sessions, standard vs compact message storage'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help='Runs per session operation')
+        parser.add_argument('--logins', type=int, default=5, help='Password checks to average')
+        parser.add_argument('--messages', type=int, default=3, help='Messages stored in the session')
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs['repeat']
+        password = 'benchmark-password'
+        encoded = make_password(password)
+        login_ms = measure(lambda: check_password(password, encoded), kwargs['logins'])
+        self.stdout.write(f"Login (PBKDF2 password check): {login_ms:.2f} ms CPU")
+
+        data = {
+            '_auth_user_id': '1',
+            '_auth_user_backend': 'django.contrib.auth.backends.ModelBackend',
+            '_auth_user_hash': encoded[-64:],
+        }
+        results = {}
+        for label, engine in (('cache', CacheStore), ('cached_db', SessionStore)):
+            results[label] = self.benchmark_engine(engine, data, repeat, login_ms)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'':32}{'cache':>12}{'cached_db':>12}")
+        for row in ('load (cache hit)', 'load (after eviction)', 'save (unchanged)', 'save (modified)'):
+            self.stdout.write(
+                f"{row:32}{results['cache'][row]:>9.3f} ms{results['cached_db'][row]:>9.3f} ms"
+            )
+        self.stdout.write(
+            "After eviction the cache engine loses the session: the user logs in again "
+            f"({login_ms:.2f} ms CPU for the password check alone)."
+        )
+
+        self.benchmark_messages(kwargs['messages'])
+
+    def benchmark_engine(self, engine, data, repeat, login_ms):
+        session = engine()
+        session.update(data)
+        session.save()
+        key = session.session_key
+        cache = session._cache
+
+        def load():
+            store = engine(key)
+            store.load()
+            return store
+
+        results = {'load (cache hit)': measure(load, repeat)}
+
+        def load_evicted():
+            cache.delete(session.cache_key)
+            store = load()
+            # Потерянная сессия означает повторный вход пользователя
+            return login_ms if store.is_empty() else 0
+
+        started = time.process_time()
+        extra = sum(load_evicted() for _ in range(repeat))
+        results['load (after eviction)'] = (time.process_time() - started) * 1000 / repeat + extra / repeat
+        cache.set(session.cache_key, data)
+
+        def save_unchanged():
+            store = load()
+            store.modified = True
+            store.save()
+
+        results['save (unchanged)'] = measure(save_unchanged, repeat)
+
+        counter = iter(range(10 ** 9))
+
+        def save_modified():
+            store = load()
+            store['counter'] = next(counter)
+            store.save()
+
+        results['save (modified)'] = measure(save_modified, repeat)
+        session.delete()
+        return results
+
+    def benchmark_messages(self, count):
+        messages = [
+            Message(constants.SUCCESS, f"Собака №{number} успешно сохранена.") for number in range(count)
+        ]
+        store = SessionStore()
+        serializer = store.serializer()
+        self.stdout.write('')
+        for label, storage_class in (('standard', SessionStorage), ('compact', CompactSessionStorage)):
+            storage = storage_class(SimpleNamespace(session={}))
+            payload = serializer.dumps({storage_class.session_key: storage.serialize_messages(messages)})
+            self.stdout.write(f"Messages payload ({label}, {count} messages): {len(payload)} bytes")
@@ -0,0 +1,137 @@
+import os
+import posixpath
+import shutil
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from users.services import get_file_models, rebuild_file_refcounts
+from users.storage import blob_name, hash_content, is_blob_name, media_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Move dog photos and avatars to content-addressed names, delete duplicate files '
+        'and rebuild file reference counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be done')
+        parser.add_argument(
+            '--delete-orphans', action='store_true',
+            help='Also delete files in the upload directories that no row references'
+        )
+
+    def handle(self, *args, **kwargs):
+        dry_run = kwargs['dry_run']
+        references = self.collect_references()
+
+        moves = {}
+        placed = set()
+        stats = {'moved': 0, 'duplicates': 0, 'missing': 0, 'reclaimed': 0}
+        for name in sorted(references):
+            if is_blob_name(name):
+                continue
+            if not media_storage.exists(name):
+                stats['missing'] += 1
+                self.stderr.write(f"Missing file: {name}")
+                continue
+            with media_storage.open(name, 'rb') as source:
+                digest = hash_content(source)
+            directory, filename = posixpath.split(name)
+            target = blob_name(directory, digest, os.path.splitext(filename)[1])
+
+            if target in placed or media_storage.exists(target):
+                stats['duplicates'] += 1
+                stats['reclaimed'] += media_storage.size(name)
+            else:
+                stats['moved'] += 1
+                if not dry_run:
+                    self.place(name, target)
+                placed.add(target)
+            moves[name] = target
+
+        if not dry_run:
+            # Сначала записи переводятся на новые имена, и только потом удаляются старые файлы
+            self.update_rows(references, moves)
+            for name in moves:
+                media_storage.delete(name)
+
+        orphans, orphan_bytes = self.find_orphans(set(references) | set(moves.values()))
+        if kwargs['delete_orphans']:
+            stats['reclaimed'] += orphan_bytes
+            if not dry_run:
+                for name in orphans:
+                    media_storage.delete(name)
+
+        blobs = 0 if dry_run else rebuild_file_refcounts()
+        prefix = 'Would reclaim' if dry_run else 'Reclaimed'
+        self.stdout.write(
+            f"Moved {stats['moved']} files, removed {stats['duplicates']} duplicates, "
+            f"{stats['missing']} missing, {len(orphans)} orphaned files ({orphan_bytes} bytes)"
+            f"{'' if kwargs['delete_orphans'] else ' kept'}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {stats['reclaimed']} bytes ({stats['reclaimed'] / 1024 / 1024:.1f} MB); "
+            f"{blobs} files tracked"
+        ))
+
+    def collect_references(self):
+        """
+        {имя файла: [(модель, pk), ...]} по всем записям с фото, аватарами и миниатюрами
+        """
+        references = defaultdict(list)
+        for model in get_file_models():
+            fields = [name for pair in model.image_variant_fields.items() for name in pair]
+            for obj in model._default_manager.only(*fields).iterator():
+                for name in obj.get_stored_files():
+                    references[name].append((model, obj.pk))
+        return references
+
+    def place(self, name, target):
+        """
+        Создает файл с именем по хешу жесткой ссылкой (без копирования данных), если это возможно
+        """
+        source_path, target_path = media_storage.path(name), media_storage.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)
+
+    def update_rows(self, references, moves):
+        rows = defaultdict(set)
+        for name in moves:
+            for model, pk in references[name]:
+                rows[model].add(pk)
+
+        for model, pks in rows.items():
+            for obj in model._default_manager.filter(pk__in=pks):
+                update_fields = []
+                for field_name, variants_field in model.image_variant_fields.items():
+                    field_file = getattr(obj, field_name)
+                    if field_file and field_file.name in moves:
+                        field_file.name = moves[field_file.name]
+                    variants = getattr(obj, variants_field) or {}
+                    setattr(obj, variants_field, {key: moves.get(value, value) for key, value in variants.items()})
+                    update_fields += [field_name, variants_field]
+                obj.save(update_fields=update_fields)
+
+    def find_orphans(self, referenced):
+        """
+        Файлы в каталогах загрузки, на которые не ссылается ни одна запись
+        """
+        directories = {
+            model._meta.get_field(field_name).upload_to.rstrip('/')
+            for model in get_file_models()
+            for field_name in model.image_variant_fields
+        }
+        orphans, size = [], 0
+        for directory in directories:
+            root = media_storage.path(directory)
+            for current, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(current, filename)
+                    name = posixpath.join(directory, os.path.relpath(path, root).replace(os.sep, '/'))
+                    if name not in referenced:
+                        orphans.append(name)
+                        size += os.path.getsize(path)
+        return orphans, size
@@ -0,0 +1,25 @@
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from users.images import ImageVariantsMixin, process_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails and WebP variants for dog photos and user avatars'
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        processed = 0
+        for model in apps.get_models():
+            if not issubclass(model, ImageVariantsMixin):
+                continue
+            for field_name, variants_field in model.image_variant_fields.items():
+                rows = model._default_manager.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+                for pk, name, variants in rows.values_list('pk', field_name, variants_field).iterator():
+                    if (variants or {}).get('source') == name:
+                        continue
+                    process_image_variants(model, pk, field_name)
+                    processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {processed} images in {time.perf_counter() - started:.1f}s'
+        ))
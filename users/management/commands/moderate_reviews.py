@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import Review
+from users.services import MODERATION_STATUSES, moderate_reviews, send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Approve or reject reviews in bulk and queue the approval emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=MODERATION_STATUSES, help='New status of the reviews')
+        parser.add_argument('--ids', type=int, nargs='+', help='Review ids to moderate')
+        parser.add_argument('--all-pending', action='store_true', help='Moderate every pending review')
+        parser.add_argument('--batch-size', type=int, default=500, help='Reviews updated per UPDATE statement')
+        parser.add_argument(
+            '--send', action='store_true', help='Send the queued emails right away over one SMTP connection'
+        )
+
+    def handle(self, *args, **kwargs):
+        if bool(kwargs['ids']) == kwargs['all_pending']:
+            raise CommandError('Pass either --ids or --all-pending')
+        review_ids = kwargs['ids']
+        if kwargs['all_pending']:
+            review_ids = Review.objects.filter(status='pending').values_list('pk', flat=True)
+
+        count = moderate_reviews(review_ids, kwargs['status'], batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} reviews set to {kwargs['status']}"))
+
+        if kwargs['send'] and kwargs['status'] == 'approved':
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = send_queued_emails()
+                total_sent += sent
+                total_failed += failed
+                if not sent:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from users.services import reconcile_review_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare per-user review statistics with approved reviews and fix mismatches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report mismatched users')
+
+    def handle(self, *args, **kwargs):
+        mismatched = reconcile_review_stats(dry_run=kwargs['dry_run'])
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Review statistics are consistent'))
+            return
+        action = 'Would fix' if kwargs['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} review statistics for {len(mismatched)} users: {', '.join(map(str, mismatched[:20]))}"
+            f"{' ...' if len(mismatched) > 20 else ''}"
+        ))
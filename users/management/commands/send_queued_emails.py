@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.services import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued outgoing emails in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help='Maximum number of emails sent over one SMTP connection'
+        )
+        parser.add_argument(
+            '--loop', action='store_true', help='Keep polling the queue until interrupted'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=5, help='Seconds to wait when the queue is empty in --loop mode'
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            sent, failed = send_queued_emails(batch_size=kwargs['batch_size'])
+            if sent or failed:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed'))
+            if not kwargs['loop']:
+                break
+            if not sent and not failed:
+                time.sleep(kwargs['interval'])
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from users.authorization import ROLES
 
 User = get_user_model()
 
@@ -9,12 +10,13 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('username', type=str, help='Username of the user')
-        parser.add_argument('role', type=str, help='Role to assign (admin/moderator/user)')
+        parser.add_argument('role', type=str, choices=ROLES, help='Role to assign (admin/moderator/user)')
 
     def handle(self, *args, **kwargs):
         username = kwargs['username']
         role = kwargs['role']
         user = User.objects.get(username=username)
         user.role = role
-        user.save()
+        # Сигнал post_save сбрасывает закэшированные права пользователя
+        user.save(update_fields=['role'])
         self.stdout.write(self.style.SUCCESS(f'Role for {username} set to {role}'))
@@ -0,0 +1,77 @@
+import logging
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+from .db import finish_request, start_request
+from .queries import (
+    enable_query_inspector, get_query_budget, install_query_recorder, start_recording, stop_recording,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Cookie со временем, до которого запросы пользователя читают данные из основной базы
+PRIMARY_COOKIE_NAME = 'db_primary_until'
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Включает чтение из реплик (ReplicaRouter) на время запроса
+    После записи пользователь получает cookie, и в течение DB_REPLICA_STICKY_SECONDS его запросы читают
+    данные из основной базы: изменения видны ему сразу, даже если реплика отстает.
+    """
+
+    def process_request(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PRIMARY_COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        start_request(read_from_replicas=not pinned)
+
+    def process_response(self, request, response):
+        if finish_request() and settings.DB_REPLICAS:
+            seconds = settings.DB_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                PRIMARY_COOKIE_NAME, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+class QueryInspectorMiddleware(MiddlewareMixin):
+    """
+    Записывает все запросы к базе данных за время запроса (QUERY_INSPECTOR, по умолчанию при DEBUG)
+    Вероятные N+1 и превышение бюджета запросов представления (QUERY_BUDGETS по имени маршрута)
+    записываются в журнал вместе со строкой шаблона и кода, из которой выполнен запрос.
+    При DEBUG сводка добавляется в заголовок ответа X-Query-Summary.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR:
+            raise MiddlewareNotUsed
+        enable_query_inspector()
+        # Соединения, открытые до создания middleware, не получают сигнал connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        request.query_recorder, request.query_recorder_token = start_recording()
+
+    def process_response(self, request, response):
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is None:
+            return response
+        stop_recording(recorder, request.query_recorder_token)
+
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        budget = get_query_budget(url_name)
+        if budget is not None and recorder.count > budget:
+            logger.warning(f"{request.path}: {recorder.count} запросов при бюджете {budget} ({url_name})")
+        for line in recorder.describe_n_plus_one():
+            logger.warning(f"{request.path}: вероятный N+1: {line}")
+        if settings.DEBUG:
+            response['X-Query-Summary'] = recorder.summary()
+        return response
@@ -1,21 +1,18 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.html import strip_tags
 from django.conf import settings
-import random
-import string
+import hashlib
+import json
+from .images import ImageVariantsMixin
+from .slugs import UniqueSlugMixin
+from .storage import get_media_storage
 
 
-def generate_random_slug(length=8):
-    """
-    Генерирует случайный slug заданной длины
-    """
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
-
-
-class CustomUser(AbstractUser):
+class CustomUser(ImageVariantsMixin, UniqueSlugMixin, AbstractUser):
     username = models.CharField(
         max_length=150, unique=True
     )
@@ -26,19 +23,6 @@ class CustomUser(AbstractUser):
         unique=True, blank=True, null=True
     )
 
-    def save(self, *args, **kwargs):
-        """
-        Автоматически генерирует slug, если он не был указан
-        """
-        if not self.slug:
-            # Генерируем уникальный slug
-            while True:
-                new_slug = generate_random_slug()
-                if not CustomUser.objects.filter(slug=new_slug).exists():
-                    self.slug = new_slug
-                    break
-        super().save(*args, **kwargs)
-
     """
     Расширенная модель пользователя с дополнительными полями
     """
@@ -60,10 +44,17 @@ class CustomUser(AbstractUser):
     )
     avatar = models.ImageField(
         upload_to='avatars/',
+        storage=get_media_storage,
         blank=True,
         null=True,
         verbose_name="Аватар"
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюры аватара"
+    )
 
     ROLE_CHOICES = (
         ('admin', 'Администратор'),
@@ -72,6 +63,12 @@ class CustomUser(AbstractUser):
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='user')
 
+    image_variant_fields = {'avatar': 'avatar_variants'}
+
+    @property
+    def avatar_images(self):
+        return self.get_image_variants('avatar')
+
     def __str__(self):
         return self.username
 
@@ -143,6 +140,21 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет отзыв и в той же транзакции обновляет статистику отзывов пользователя
+        Строка отзыва блокируется, поэтому одновременное одобрение не учитывается дважды.
+        """
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'target_user_id', 'status', 'rating'
+                ).first()
+            super().save(*args, **kwargs)
+            changes = UserReviewStats.get_changes(previous, (self.target_user_id, self.status, self.rating))
+            UserReviewStats.apply_changes(changes)
+
     def approve(self):
         """
         Одобрение отзыва и отправка уведомления автору
@@ -162,22 +174,298 @@ class Review(models.Model):
         """
         Отправка уведомления автору отзыва о его одобрении
         """
-        subject = 'Ваш отзыв был одобрен!'
-        html_message = render_to_string('emails/review_approved_email.html', {'review': self})
-        plain_message = strip_tags(html_message)
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.author.email],
-            html_message=html_message,
-            fail_silently=False,
+        message = self.get_approval_message()
+        OutgoingEmail.enqueue(
+            message['subject'],
+            message['message'],
+            message['recipient_list'],
+            html_message=message['html_message'],
         )
 
+    def get_approval_message(self, template=None):
+        """
+        Письмо автору об одобрении отзыва (template - заранее загруженный шаблон при пакетной отправке)
+        """
+        context = {'review': self}
+        if template is not None:
+            html_message = template.render(context)
+        else:
+            html_message = render_to_string('emails/review_approved_email.html', context)
+        return {
+            'subject': 'Ваш отзыв был одобрен!',
+            'message': strip_tags(html_message),
+            'html_message': html_message,
+            'recipient_list': [self.author.email],
+        }
+
     def __str__(self):
         return f"Отзыв от {self.author.username} для {self.target_user.username}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Отзывы пользователя с нужным статусом, новые первыми (страница пользователя)
+            models.Index(fields=['target_user', 'status', '-created_at'], name='review_target_status_idx'),
+            # Очередь модерации: отзывы на рассмотрении по времени создания
+            models.Index(fields=['status', 'created_at', 'id'], name='review_status_created_idx'),
+        ]
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+
+
+class UserReviewStats(models.Model):
+    """
+    Статистика одобренных отзывов о пользователе: количество, сумма оценок и число оценок 1-5
+    Обновляется при сохранении и удалении отзывов (Review.save, сигнал post_delete),
+    сверяется с отзывами командой reconcile_review_stats.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='review_stats',
+        verbose_name="Пользователь"
+    )
+    review_count = models.IntegerField(default=0, verbose_name="Одобренных отзывов")
+    rating_sum = models.IntegerField(default=0, verbose_name="Сумма оценок")
+    rating_1 = models.IntegerField(default=0, verbose_name="Оценок 1")
+    rating_2 = models.IntegerField(default=0, verbose_name="Оценок 2")
+    rating_3 = models.IntegerField(default=0, verbose_name="Оценок 3")
+    rating_4 = models.IntegerField(default=0, verbose_name="Оценок 4")
+    rating_5 = models.IntegerField(default=0, verbose_name="Оценок 5")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    RATINGS = range(1, 6)
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def histogram(self):
+        """
+        [(оценка, количество), ...] от 5 до 1
+        """
+        return [(rating, getattr(self, f'rating_{rating}')) for rating in reversed(self.RATINGS)]
+
+    @staticmethod
+    def get_changes(previous, current):
+        """
+        Изменения статистики при переходе отзыва из состояния previous в current
+        Состояние: (target_user_id, status, rating) или None. Возвращает {(user_id, rating): +1/-1}
+        """
+        changes = {}
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is not None and state[1] == 'approved':
+                key = (state[0], state[2])
+                changes[key] = changes.get(key, 0) + sign
+        return {key: delta for key, delta in changes.items() if delta}
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Применяет изменения {(user_id, rating): delta} атомарными UPDATE с F()
+        """
+        per_user = {}
+        for (user_id, rating), delta in changes.items():
+            per_user.setdefault(user_id, {})[rating] = delta
+        for user_id, ratings in per_user.items():
+            values = {
+                'review_count': sum(ratings.values()),
+                'rating_sum': sum(rating * delta for rating, delta in ratings.items()),
+                **{f'rating_{rating}': delta for rating, delta in ratings.items()},
+            }
+            updates = {field: F(field) + delta for field, delta in values.items()}
+            if cls.objects.filter(user_id=user_id).update(**updates, updated_at=timezone.now()):
+                continue
+            if values['review_count'] <= 0:
+                # Статистики нет (например, пользователь удаляется вместе с отзывами): уменьшать нечего
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(user_id=user_id, **values)
+            except IntegrityError:
+                # Строку одновременно создал другой запрос
+                cls.objects.filter(user_id=user_id).update(**updates, updated_at=timezone.now())
+
+    def __str__(self):
+        return f"{self.user_id}: {self.review_count} отзывов"
+
+    class Meta:
+        verbose_name = "Статистика отзывов"
+        verbose_name_plural = "Статистика отзывов"
+
+
+class OutgoingEmail(models.Model):
+    """
+    Очередь исходящих писем
+    Представления только ставят письма в очередь, отправку выполняет команда send_queued_emails
+    """
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка отправки'),
+    )
+
+    subject = models.CharField(
+        max_length=255,
+        verbose_name="Тема"
+    )
+    message = models.TextField(verbose_name="Текст письма")
+    html_message = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="HTML-версия письма"
+    )
+    from_email = models.CharField(
+        max_length=254,
+        verbose_name="Отправитель"
+    )
+    recipients = models.TextField(verbose_name="Получатели")
+    # Письма с учетными данными (временный пароль): текст стирается после отправки и не показывается в админке
+    sensitive = models.BooleanField(
+        default=False,
+        verbose_name="Содержит учетные данные"
+    )
+    dedup_key = models.CharField(
+        max_length=64,
+        db_index=True,
+        verbose_name="Ключ дедупликации"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Статус"
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Количество попыток"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Следующая попытка"
+    )
+    last_error = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Последняя ошибка"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    @staticmethod
+    def make_dedup_key(subject, message, html_message, from_email, recipient_list):
+        """
+        Вычисляет ключ дедупликации по содержимому письма
+        """
+        payload = json.dumps(
+            [subject, message, html_message, from_email, sorted(recipient_list)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def enqueue(cls, subject, message, recipient_list, html_message=None, from_email=None, sensitive=False):
+        """
+        Ставит письмо в очередь на отправку
+        Если такое же письмо уже ожидает отправки, повторно оно не добавляется
+        sensitive - письмо содержит учетные данные, его текст стирается после отправки
+        """
+        recipient_list = [email for email in recipient_list if email]
+        if not recipient_list:
+            return None
+
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        dedup_key = cls.make_dedup_key(subject, message, html_message, from_email, recipient_list)
+        existing = cls.objects.filter(dedup_key=dedup_key, status='pending').first()
+        if existing:
+            return existing
+
+        return cls.objects.create(
+            subject=subject,
+            message=message,
+            html_message=html_message,
+            from_email=from_email,
+            recipients=','.join(recipient_list),
+            sensitive=sensitive,
+            dedup_key=dedup_key,
+        )
+
+    @classmethod
+    def enqueue_many(cls, messages, batch_size=500):
+        """
+        Ставит в очередь много писем: одна проверка дубликатов и bulk_create на пакет
+        messages - словари с ключами subject, message, recipient_list, html_message
+        """
+        from_email = settings.DEFAULT_FROM_EMAIL
+        emails = {}
+        for item in messages:
+            recipient_list = [email for email in item['recipient_list'] if email]
+            if not recipient_list:
+                continue
+            html_message = item.get('html_message')
+            dedup_key = cls.make_dedup_key(item['subject'], item['message'], html_message, from_email, recipient_list)
+            emails[dedup_key] = cls(
+                subject=item['subject'],
+                message=item['message'],
+                html_message=html_message,
+                from_email=from_email,
+                recipients=','.join(recipient_list),
+                dedup_key=dedup_key,
+            )
+
+        keys = list(emails)
+        created = []
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            existing = set(
+                cls.objects.filter(dedup_key__in=chunk, status='pending').values_list('dedup_key', flat=True)
+            )
+            created += cls.objects.bulk_create([emails[key] for key in chunk if key not in existing])
+        return created
+
+    def get_recipient_list(self):
+        return self.recipients.split(',')
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipients}"
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище по хешу содержимого и количество записей, которые на него ссылаются
+    Когда ссылок не остается, файл удаляется
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="Имя файла"
+    )
+    size = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Размер"
+    )
+    ref_count = models.IntegerField(
+        default=0,
+        verbose_name="Количество ссылок"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+    class Meta:
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
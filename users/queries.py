@@ -0,0 +1,194 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+# Активные QueryRecorder: запроса (QueryInspectorMiddleware) и вложенных блоков query_budget
+# ContextVar переходит и в потоки sync_to_async/run_blocking, поэтому учитываются запросы асинхронных представлений
+_recorders = ContextVar('query_recorders', default=())
+
+# Числа в тексте запроса (LIMIT 21, TOP 20) и списки параметров IN (%s, %s, ...) не различают запросы
+NUMBER_RE = re.compile(r'\b\d+\b')
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+TEMPLATE_FILE = os.path.join('django', 'template', 'base.py')
+THIS_FILE = os.path.abspath(__file__)
+
+
+def normalize_sql(sql):
+    """
+    Текст запроса без значений: запросы N+1 отличаются только параметрами
+    """
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def find_origin():
+    """
+    Место, из которого выполнен запрос: строка шаблона (узел, который отрисовывался)
+    и ближайшая строка кода проекта (представление, сервис)
+    """
+    template, code = None, None
+    frame = sys._getframe(1)
+    while frame is not None and (template is None or code is None):
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code.co_name == 'render_annotated' and filename.endswith(TEMPLATE_FILE):
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template = f"{origin.template_name}:{token.lineno}"
+        elif (
+            code is None and filename.startswith(str(settings.BASE_DIR))
+            and 'site-packages' not in filename and os.path.abspath(filename) != THIS_FILE
+        ):
+            code = f"{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return template, code
+
+
+def get_common_origin(group):
+    """
+    Самое частое место вызова в группе одинаковых запросов (в группу может попасть и похожий запрос из другого места)
+    """
+    return Counter((query['template'], query['code']) for query in group).most_common(1)[0][0]
+
+
+class QueryRecorder:
+    """
+    Запросы к базе данных за время запроса: текст, база, длительность и место вызова
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, sql, alias, duration, origin):
+        template, code = origin
+        self.queries.append({
+            'sql': sql, 'alias': alias, 'duration': duration, 'template': template, 'code': code,
+        })
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def repeated(self):
+        """
+        Группы одинаковых (без учета параметров) запросов: {текст: [запросы]}, только повторяющиеся
+        """
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[normalize_sql(query['sql'])].append(query)
+        return {sql: group for sql, group in groups.items() if len(group) > 1}
+
+    def n_plus_one(self, threshold=None):
+        """
+        Вероятные N+1: одинаковые запросы, выполненные не меньше threshold раз
+        """
+        threshold = threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+        return {sql: group for sql, group in self.repeated().items() if len(group) >= threshold}
+
+    def describe_n_plus_one(self, threshold=None):
+        lines = []
+        for sql, group in self.n_plus_one(threshold).items():
+            template, code = get_common_origin(group)
+            place = ', '.join(filter(None, (template, code))) or 'unknown'
+            lines.append(f"{len(group)}x at {place}: {sql[:200]}")
+        return lines
+
+    def summary(self):
+        """
+        Краткая сводка для заголовка ответа X-Query-Summary
+        """
+        parts = [f"{self.count} queries", f"{self.duration * 1000:.1f} ms", f"{len(self.repeated())} repeated"]
+        for group in self.n_plus_one().values():
+            template, code = get_common_origin(group)
+            parts.append(f"N+1 {len(group)}x at {template or code or 'unknown'}")
+        return '; '.join(parts)
+
+
+def record_query(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        origin = find_origin()
+        for recorder in recorders:
+            recorder.record(sql, context['connection'].alias, duration, origin)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def enable_query_inspector():
+    """
+    Подключает запись запросов ко всем соединениям (вызывается при запуске, если QUERY_INSPECTOR)
+    """
+    connection_created.connect(install_query_recorder, dispatch_uid='users.queries.install_query_recorder')
+
+
+def start_recording():
+    recorder = QueryRecorder()
+    return recorder, _recorders.set(_recorders.get() + (recorder,))
+
+
+def stop_recording(recorder, token):
+    try:
+        _recorders.reset(token)
+    except ValueError:
+        # Токен создан в другом контексте (асинхронный запрос): удаляем только свой recorder
+        _recorders.set(tuple(item for item in _recorders.get() if item is not recorder))
+
+
+def get_query_budget(name):
+    return settings.QUERY_BUDGETS.get(name)
+
+
+@contextmanager
+def query_budget(budget, n_plus_one_threshold=None):
+    """
+    Помощник для тестов: проверяет, что блок выполняет не больше budget запросов и не содержит N+1
+    budget - число или имя маршрута из QUERY_BUDGETS. Пример:
+        with query_budget('dog_list'):
+            client.get(reverse('dog_list'))
+    """
+    limit = get_query_budget(budget) if isinstance(budget, str) else budget
+    enable_query_inspector()
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(None, connection)
+
+    recorder, token = start_recording()
+    try:
+        yield recorder
+    finally:
+        stop_recording(recorder, token)
+
+    problems = []
+    if limit is not None and recorder.count > limit:
+        problems.append(f"{recorder.count} queries, budget {limit}")
+    problems += recorder.describe_n_plus_one(n_plus_one_threshold)
+    if problems:
+        queries = '\n'.join(f"  {query['sql']}" for query in recorder.queries)
+        raise AssertionError('\n'.join(problems) + f"\nQueries:\n{queries}")
@@ -0,0 +1,325 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .images import ImageVariantsMixin
+from .models import MediaBlob, OutgoingEmail, Review, UserReviewStats
+from .storage import is_blob_name, media_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_retry_delay(attempts):
+    """
+    Вычисляет задержку перед следующей попыткой (экспоненциальный рост)
+    """
+    return timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def build_message(email, connection):
+    """
+    Собирает объект письма Django из записи очереди
+    """
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.message,
+        from_email=email.from_email,
+        to=email.get_recipient_list(),
+        connection=connection,
+    )
+    if email.html_message:
+        message.attach_alternative(email.html_message, 'text/html')
+    return message
+
+
+def mark_failed_attempt(email, error, now):
+    """
+    Фиксирует неудачную попытку отправки и планирует повтор
+    После EMAIL_OUTBOX_MAX_ATTEMPTS попыток письмо помечается как неотправленное
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+    update_fields = ['attempts', 'last_error', 'status', 'next_attempt_at']
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+        if email.sensitive:
+            email.message, email.html_message = '', None
+            update_fields += ['message', 'html_message']
+        logger.error(f"Письмо {email.pk} не отправлено после {email.attempts} попыток: {error}")
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = now + get_retry_delay(email.attempts)
+        logger.warning(f"Ошибка отправки письма {email.pk}, попытка {email.attempts}: {error}")
+    email.save(update_fields=update_fields)
+
+
+def mark_sent(email):
+    """
+    Отмечает письмо отправленным сразу после отправки, текст письма с учетными данными стирается
+    Отметка по одному письму: сбой дальше в пакете не приведет к повторной отправке уже доставленных писем
+    """
+    fields = {'status': 'sent', 'sent_at': timezone.now()}
+    if email.sensitive:
+        fields.update(message='', html_message=None)
+    return OutgoingEmail.objects.filter(pk=email.pk).update(**fields)
+
+
+def claim_queued_emails(batch_size, now):
+    """
+    Забирает пакет писем на отправку: помечает их 'sending' и фиксирует транзакцию до обращения к SMTP
+    Письма, зависшие в 'sending' дольше EMAIL_OUTBOX_CLAIM_TIMEOUT (обработчик упал), забираются снова.
+    """
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        claimed_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status='sending', next_attempt_at=claimed_until,
+        )
+    return emails
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Отправляет пакет писем из очереди через одно SMTP-соединение
+    Одинаковые письма в пакете отправляются один раз
+    Возвращает кортеж (отправлено, с ошибкой)
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    sent_count = failed_count = 0
+
+    emails = claim_queued_emails(batch_size, now)
+    if not emails:
+        return sent_count, failed_count
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in emails:
+            mark_failed_attempt(email, exc, now)
+        return sent_count, len(emails)
+
+    sent_keys = set()
+    try:
+        for email in emails:
+            if email.dedup_key not in sent_keys:
+                try:
+                    build_message(email, connection).send()
+                except Exception as exc:
+                    mark_failed_attempt(email, exc, now)
+                    failed_count += 1
+                    continue
+                sent_keys.add(email.dedup_key)
+
+            sent_count += mark_sent(email)
+    finally:
+        connection.close()
+
+    logger.info(f"Отправлено писем: {sent_count}, с ошибкой: {failed_count}.")
+    return sent_count, failed_count
+
+
+def get_file_models():
+    """
+    Модели, записи которых ссылаются на файлы в хранилище по хешу
+    """
+    return [model for model in apps.get_models() if issubclass(model, ImageVariantsMixin)]
+
+
+def acquire_files(names):
+    """
+    Увеличивает счетчики ссылок на файлы (создает записи для новых файлов)
+    Учитываются только файлы с именем по хешу: старые файлы переносит команда dedupe_media
+    """
+    for name in sorted(name for name in names if is_blob_name(name)):
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            continue
+        size = media_storage.size(name) if media_storage.exists(name) else 0
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, ref_count=1)
+        except IntegrityError:
+            MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release_files(names):
+    """
+    Уменьшает счетчики ссылок; файлы без ссылок удаляются после фиксации транзакции
+    Счетчик перепроверяется под блокировкой записи: тот же файл мог быть сохранен заново
+    (ContentAddressedStorage._save), и тогда транзакция сохранения успевает добавить на него ссылку.
+    """
+    names = sorted(name for name in names if is_blob_name(name))
+    if not names:
+        return
+    MediaBlob.objects.filter(name__in=names).update(ref_count=F('ref_count') - 1)
+
+    def delete_unreferenced():
+        for name in names:
+            with transaction.atomic():
+                blob = MediaBlob.objects.select_for_update().filter(name=name, ref_count__lte=0).first()
+                if blob is not None:
+                    blob.delete()
+                    media_storage.delete(name)
+    transaction.on_commit(delete_unreferenced)
+
+
+def remember_stored_files(instance):
+    """
+    Запоминает файлы записи при загрузке из базы данных, чтобы после сохранения найти изменения
+    """
+    instance._stored_files = instance.get_stored_files() if instance.pk else set()
+
+
+def update_file_references(instance, created=False):
+    """
+    Обновляет счетчики ссылок после сохранения записи: новые файлы +1, замененные -1
+    """
+    current = instance.get_stored_files()
+    previous = getattr(instance, '_stored_files', None)
+    if current is None:
+        return
+    if previous is None:
+        if not created:
+            # Исходные файлы неизвестны (запись загружена с отложенными полями): счетчики поправит dedupe_media
+            instance._stored_files = current
+            return
+        previous = set()
+    acquire_files(current - previous)
+    release_files(previous - current)
+    instance._stored_files = current
+
+
+def release_file_references(instance):
+    names = getattr(instance, '_stored_files', None)
+    if names is None:
+        names = instance.get_stored_files() or set()
+    release_files(names)
+
+
+def rebuild_file_refcounts():
+    """
+    Пересчитывает счетчики ссылок по всем записям
+    Возвращает количество учтенных файлов
+    """
+    counts = Counter()
+    for model in get_file_models():
+        fields = [name for pair in model.image_variant_fields.items() for name in pair]
+        for obj in model._default_manager.only(*fields).iterator():
+            counts.update(name for name in obj.get_stored_files() if is_blob_name(name))
+
+    blobs = [
+        MediaBlob(name=name, ref_count=count, size=media_storage.size(name) if media_storage.exists(name) else 0)
+        for name, count in counts.items()
+    ]
+    with transaction.atomic():
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.bulk_create(blobs, batch_size=500)
+    return len(blobs)
+
+
+def count_review_stats(user_ids=None):
+    """
+    Одобренные отзывы по пользователям и оценкам одним запросом: {user_id: {оценка: количество}}
+    """
+    queryset = Review.objects.filter(status='approved')
+    if user_ids is not None:
+        queryset = queryset.filter(target_user_id__in=user_ids)
+    counts = defaultdict(dict)
+    rows = queryset.values('target_user_id', 'rating').annotate(count=Count('id')).order_by()
+    for row in rows:
+        counts[row['target_user_id']][row['rating']] = row['count']
+    return counts
+
+
+def get_review_stats_values(ratings):
+    """
+    Значения полей UserReviewStats по числу отзывов с каждой оценкой
+    """
+    return {
+        'review_count': sum(ratings.values()),
+        'rating_sum': sum(rating * count for rating, count in ratings.items()),
+        **{f'rating_{rating}': ratings.get(rating, 0) for rating in UserReviewStats.RATINGS},
+    }
+
+
+def reconcile_review_stats(dry_run=False):
+    """
+    Сверяет статистику отзывов с самими отзывами и исправляет расхождения
+    Статистика расходящегося пользователя пересчитывается под блокировкой его строки,
+    чтобы не потерять одновременные изменения. Возвращает id пользователей с расхождениями
+    """
+    expected = count_review_stats()
+    fields = list(get_review_stats_values({}))
+    existing = {
+        row['user_id']: {field: row[field] for field in fields}
+        for row in UserReviewStats.objects.values('user_id', *fields)
+    }
+    mismatched = sorted(
+        user_id for user_id in set(expected) | set(existing)
+        if get_review_stats_values(expected.get(user_id, {})) != existing.get(user_id, get_review_stats_values({}))
+    )
+    if dry_run:
+        return mismatched
+
+    for user_id in mismatched:
+        with transaction.atomic():
+            UserReviewStats.objects.select_for_update().filter(user_id=user_id).first()
+            values = get_review_stats_values(count_review_stats([user_id]).get(user_id, {}))
+            UserReviewStats.objects.update_or_create(user_id=user_id, defaults=values)
+    return mismatched
+
+
+# Статусы, которые можно установить массовой модерацией
+MODERATION_STATUSES = ('approved', 'rejected')
+
+
+def moderate_reviews(review_ids, status, batch_size=500):
+    """
+    Массовая модерация: отзывы пакетами по batch_size (ограничение числа параметров запроса в SQL Server)
+    В каждом пакете: блокировка выбранных строк, один UPDATE статуса, изменение статистики пользователей
+    и постановка писем об одобрении в очередь одним bulk_create - все в одной транзакции.
+    Письма отправляет send_queued_emails через одно SMTP-соединение. Возвращает количество измененных отзывов
+    """
+    if status not in MODERATION_STATUSES:
+        raise ValueError(f"Недопустимый статус модерации: {status}")
+    review_ids = sorted(set(review_ids))
+    template = get_template('emails/review_approved_email.html') if status == 'approved' else None
+    changed = 0
+    for start in range(0, len(review_ids), batch_size):
+        chunk = review_ids[start:start + batch_size]
+        with transaction.atomic():
+            rows = list(
+                Review.objects.select_for_update().filter(pk__in=chunk).exclude(status=status)
+                .values_list('pk', 'target_user_id', 'status', 'rating')
+            )
+            if not rows:
+                continue
+            ids = [row[0] for row in rows]
+            Review.objects.filter(pk__in=ids).update(status=status, updated_at=timezone.now())
+
+            changes = Counter()
+            for pk, target_user_id, previous_status, rating in rows:
+                changes.update(UserReviewStats.get_changes(
+                    (target_user_id, previous_status, rating), (target_user_id, status, rating)
+                ))
+            UserReviewStats.apply_changes({key: delta for key, delta in changes.items() if delta})
+
+            if template is not None:
+                reviews = Review.objects.filter(pk__in=ids).select_related('author', 'target_user')
+                OutgoingEmail.enqueue_many(review.get_approval_message(template) for review in reviews)
+            changed += len(ids)
+
+    logger.info(f"Массовая модерация: {changed} отзывов переведены в статус {status}.")
+    return changed
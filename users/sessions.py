@@ -0,0 +1,65 @@
+import hashlib
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.session import SessionStorage
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils.safestring import SafeData, mark_safe
+
+
+class SessionStore(CachedDBStore):
+    """
+    Сессии в кэше (Redis) с постоянной копией в базе данных (write-through)
+    При вытеснении ключа из Redis сессия восстанавливается из базы данных, и пользователю не нужно
+    входить заново (проверка пароля PBKDF2 - самая дорогая операция при входе).
+    Сессия, данные которой не изменились с момента загрузки, повторно не сохраняется.
+    """
+
+    def load(self):
+        data = super().load()
+        self._loaded_digest = self.get_digest(data)
+        return data
+
+    def get_digest(self, data):
+        return hashlib.sha1(self.serializer().dumps(data)).hexdigest()
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and self.session_key is not None
+            and getattr(self, '_loaded_digest', None) == self.get_digest(self._get_session(no_load=True))
+        ):
+            # Данные отмечены измененными (например, при чтении пустых сообщений), но совпадают с сохраненными
+            return
+        super().save(must_create)
+        self._loaded_digest = self.get_digest(self._session)
+
+
+class CompactSessionStorage(SessionStorage):
+    """
+    Хранение сообщений в сессии компактными списками [уровень, текст, (теги), (безопасный HTML)]
+    вместо JSON-строки MessageEncoder, которая при сериализации сессии кодируется второй раз
+    """
+
+    def serialize_messages(self, messages):
+        data = []
+        for message in messages:
+            item = [message.level, str(message.message)]
+            is_safe = isinstance(message.message, SafeData)
+            if message.extra_tags or is_safe:
+                item.append(message.extra_tags or '')
+            if is_safe:
+                item.append(1)
+            data.append(item)
+        return data
+
+    def deserialize_messages(self, data):
+        if not data or isinstance(data, str):
+            # Пусто или сообщения, сохраненные стандартным SessionStorage
+            return super().deserialize_messages(data)
+        messages = []
+        for item in data:
+            level, text = item[0], item[1]
+            extra_tags = item[2] if len(item) > 2 else None
+            if len(item) > 3 and item[3]:
+                text = mark_safe(text)
+            messages.append(Message(level, text, extra_tags=extra_tags or None))
+        return messages
@@ -0,0 +1,106 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from .authorization import ACCESS_FIELDS, invalidate_access
+from .images import schedule_image_variants
+from .models import CustomUser, Review, UserReviewStats
+from .services import release_file_references, remember_stored_files, update_file_references
+
+
+@receiver(post_save, sender=CustomUser)
+def generate_avatar_variants(sender, instance, **kwargs):
+    """
+    Создает миниатюры аватара в фоновом потоке после фиксации транзакции
+    """
+    schedule_image_variants(instance, 'avatar')
+
+
+@receiver(post_init, sender=CustomUser)
+def remember_avatar_files(sender, instance, **kwargs):
+    remember_stored_files(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def update_avatar_references(sender, instance, created, **kwargs):
+    """
+    Обновляет счетчики ссылок на файлы аватара и его миниатюр
+    """
+    update_file_references(instance, created)
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_avatar_references(sender, instance, **kwargs):
+    release_file_references(instance)
+
+
+@receiver(post_delete, sender=Review)
+def update_review_stats(sender, instance, **kwargs):
+    """
+    Удаление одобренного отзыва уменьшает статистику отзывов пользователя
+    """
+    previous = (instance.target_user_id, instance.status, instance.rating)
+    UserReviewStats.apply_changes(UserReviewStats.get_changes(previous, None))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_access(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Изменение роли или флагов пользователя (в том числе командой set_role) сбрасывает его права в кэше
+    """
+    if created or (update_fields is not None and not set(update_fields) & set(ACCESS_FIELDS)):
+        return
+    instance.__dict__.pop('_access', None)
+    invalidate_access([instance.pk])
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_user_access(sender, instance, **kwargs):
+    invalidate_access([instance.pk])
+
+
+def get_group_user_ids(group_ids):
+    return list(CustomUser.objects.filter(groups__in=group_ids).values_list('pk', flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def invalidate_member_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Изменение групп или прав пользователя: user.groups.add(...) или group.user_set.add(...)
+    """
+    if not reverse:
+        if action.startswith('post_'):
+            instance.__dict__.pop('_access', None)
+            invalidate_access([instance.pk])
+    elif action == 'pre_clear':
+        # После очистки связей пользователей группы уже не найти
+        instance._access_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidate_access(getattr(instance, '_access_user_ids', []))
+    elif action.startswith('post_'):
+        invalidate_access(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Изменение прав группы сбрасывает права всех ее участников
+    """
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_access(get_group_user_ids([instance.pk]))
+    elif action == 'pre_clear':
+        instance._access_user_ids = get_group_user_ids(instance.group_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidate_access(getattr(instance, '_access_user_ids', []))
+    elif action.startswith('post_'):
+        invalidate_access(get_group_user_ids(pk_set))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_access(sender, instance, **kwargs):
+    """
+    Переименование или удаление группы меняет права ее участников (группа moderators, AUTH_GROUPS)
+    """
+    invalidate_access(get_group_user_ids([instance.pk]))
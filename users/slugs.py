@@ -0,0 +1,54 @@
+import secrets
+import string
+from django.db import IntegrityError, transaction
+
+
+SLUG_ALPHABET = string.ascii_lowercase + string.digits
+
+# 36^10 ≈ 3.6 * 10^15 вариантов: коллизия практически исключена и без проверки в базе данных
+SLUG_LENGTH = 10
+
+# Количество попыток вставки с новым slug при (крайне маловероятной) коллизии
+SLUG_MAX_ATTEMPTS = 5
+
+
+def generate_slug(length=SLUG_LENGTH):
+    """
+    Генерирует случайный slug заданной длины
+    """
+    return ''.join(secrets.choice(SLUG_ALPHABET) for _ in range(length))
+
+
+def fill_slugs(objects):
+    """
+    Заполняет slug у объектов перед bulk_create
+    """
+    for obj in objects:
+        if not obj.slug:
+            obj.slug = generate_slug()
+    return objects
+
+
+class UniqueSlugMixin:
+    """
+    Примесь для моделей с уникальным полем slug
+    Slug генерируется без предварительного запроса к базе данных:
+    уникальность обеспечивает ограничение UNIQUE, а при коллизии вставка повторяется с новым slug
+    """
+
+    def save(self, *args, **kwargs):
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        using = kwargs.get('using') or 'default'
+        for attempt in range(SLUG_MAX_ATTEMPTS):
+            self.slug = generate_slug()
+            try:
+                with transaction.atomic(using=using):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if not type(self)._default_manager.using(using).filter(slug=self.slug).exists():
+                    self.slug = None
+                    raise
+        self.slug = None
+        raise IntegrityError(f"Не удалось подобрать уникальный slug за {SLUG_MAX_ATTEMPTS} попыток.")
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+
+# Имя файла в хранилище: <каталог>/<первые 2 символа хеша>/<sha256>.<расширение>
+BLOB_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def hash_content(source, chunk_size=64 * 1024):
+    """
+    SHA-256 файлового объекта, прочитанного по частям
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_name(directory, digest, extension):
+    return posixpath.join(directory, digest[:2], f"{digest}{extension.lower()}")
+
+
+def is_blob_name(name):
+    return bool(name) and BLOB_NAME_RE.search(name) is not None
+
+
+def lock_blob(name):
+    """
+    Блокирует запись MediaBlob файла до конца транзакции (запись может отсутствовать)
+    """
+    from .models import MediaBlob
+
+    list(MediaBlob.objects.select_for_update().filter(name=name).values_list('pk', flat=True))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла определяется хешем содержимого
+    Файл хешируется во время записи во временный файл и затем переименовывается в имя по хешу;
+    одинаковые файлы хранятся один раз. Каталог из upload_to сохраняется: dogs/3f/3f9c...jpg.
+    Файлы удаляются, когда на них не остается ссылок (users.services.release_files).
+    Существующий файл используется повторно под блокировкой его записи MediaBlob: удаление файла без ссылок
+    ждет конца транзакции сохранения, в которой на файл появляется ссылка, поэтому модели с файлами
+    сохраняются в транзакции (ImageVariantsMixin.save).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя выбирает _save по хешу, поэтому переименование при совпадении имен не нужно
+        return name
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1]
+        os.makedirs(self.location, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(handle, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            final_name = blob_name(directory, digest.hexdigest(), extension)
+            final_path = self.path(final_name)
+            with transaction.atomic():
+                # Наличие файла проверяется после блокировки: удаленный тем временем файл записывается заново
+                lock_blob(final_name)
+                if os.path.exists(final_path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                    os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    """
+    Хранилище для фото собак и аватаров (вызываемый объект, чтобы не попадать в миграции)
+    """
+    return media_storage
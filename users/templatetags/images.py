@@ -0,0 +1,18 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('users/picture.html')
+def picture(images, size, alt='', css_class='', width=None):
+    """
+    Выводит миниатюру в <picture>: WebP для поддерживающих браузеров, JPEG для остальных
+    Пример: {% picture dog.photo_images 'thumb' dog.name width=100 %}
+    """
+    return {
+        'webp_url': images.url(size, 'webp'),
+        'jpeg_url': images.url(size, 'jpeg'),
+        'alt': alt,
+        'css_class': css_class,
+        'width': width,
+    }
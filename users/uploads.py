@@ -0,0 +1,115 @@
+import os
+import tempfile
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Допустимые форматы загружаемых изображений: расширение и MIME-тип результата
+UPLOAD_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Обработчик загрузки: файл сразу пишется во временный файл на диске, а не в память процесса
+    После UPLOAD_MAX_SIZE байт запись прекращается, остаток запроса отбрасывается,
+    а файл помечается как слишком большой (ошибку показывает форма).
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            self.too_large = True
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.upload_too_large = self.too_large
+        return file
+
+
+def normalize_image(upload):
+    """
+    Проверяет и нормализует загруженное изображение:
+    - формат и размеры читаются из заголовка, без декодирования пикселей;
+    - слишком большие изображения отклоняются до декодирования;
+    - JPEG декодируется сразу в уменьшенном масштабе (draft), затем уменьшается reduce и thumbnail
+      до IMAGE_UPLOAD_MAX_DIMENSION;
+    - ориентация из EXIF применяется к пикселям, сами метаданные EXIF (в том числе GPS) не сохраняются.
+    Возвращает новый UploadedFile во временном файле
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if image.format not in UPLOAD_FORMATS:
+        raise forms.ValidationError(
+            "Поддерживаются только изображения JPEG, PNG и WebP.", code='invalid_image'
+        )
+    width, height = image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise forms.ValidationError(
+            f"Изображение слишком большое ({width}x{height}).", code='too_many_pixels'
+        )
+
+    image_format = image.format
+    max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+    ratio = min(max_dimension / width, max_dimension / height)
+    if ratio < 1:
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8), не меньше итогового размера;
+        # thumbnail() доуменьшает изображение через reduce() и фильтр LANCZOS
+        image.draft(image.mode, (max(1, int(width * ratio)), max(1, int(height * ratio))))
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+
+    extension, content_type = UPLOAD_FORMATS[image_format]
+    options = {'optimize': True}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = settings.IMAGE_UPLOAD_QUALITY
+
+    output = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, format=image_format, **options)
+    size = output.tell()
+    output.seek(0)
+
+    name = f"{os.path.splitext(os.path.basename(upload.name))[0]}.{extension}"
+    return UploadedFile(output, name=name, content_type=content_type, size=size)
+
+
+class NormalizedImageField(forms.ImageField):
+    """
+    Поле формы для фото и аватаров: ограничение размера, проверка заголовка и нормализация normalize_image
+    """
+    default_error_messages = {
+        'too_large': "Файл слишком большой: максимум %(max_size)s.",
+    }
+
+    def to_python(self, data):
+        # Проверка ImageField (Image.verify) заменяется проверкой заголовка в normalize_image
+        upload = forms.FileField.to_python(self, data)
+        if upload is None:
+            return None
+        if getattr(upload, 'upload_too_large', False) or upload.size > settings.UPLOAD_MAX_SIZE:
+            raise forms.ValidationError(
+                self.error_messages['too_large'],
+                code='too_large',
+                params={'max_size': filesizeformat(settings.UPLOAD_MAX_SIZE)},
+            )
+        try:
+            return normalize_image(upload)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as exc:
+            raise forms.ValidationError(self.error_messages['invalid_image'], code='invalid_image') from exc
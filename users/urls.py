@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
+    AsyncProfileView,
+    AsyncUserDetailView,
     HomeView,
     UserCreateView,
     UserLoginView,
@@ -14,6 +17,7 @@ from .views import (
     ReviewCreateView,
     ReviewModerationListView,
     ReviewModerationUpdateView,
+    ReviewBulkModerationView,
 )
 
 urlpatterns = [
@@ -27,7 +31,8 @@ urlpatterns = [
     path('login/', UserLoginView.as_view(), name='login'),
 
     # Просмотр профиля
-    path('profile/<slug:slug>/', ProfileView.as_view(), name='profile'),
+    # Под ASGI профиль и просмотр пользователя обслуживаются асинхронными представлениями
+    path('profile/<slug:slug>/', (AsyncProfileView if settings.ASYNC_VIEWS else ProfileView).as_view(), name='profile'),
 
     # Список собак пользователя
     path('my-dogs/', MyDogsView.as_view(), name='my_dogs'),
@@ -48,7 +53,11 @@ urlpatterns = [
     path('users/', UserListView.as_view(), name='user-list'),
 
     # Подробный просмотр профиля пользователя (доступно только модераторам/админам)
-    path('users/<int:pk>/', UserDetailView.as_view(), name='user-detail'),
+    path(
+        'users/<int:pk>/',
+        (AsyncUserDetailView if settings.ASYNC_VIEWS else UserDetailView).as_view(),
+        name='user-detail',
+    ),
 
     # Создание отзыва о пользователе (доступно всем авторизованным пользователям)
     path('users/<int:user_id>/review/', ReviewCreateView.as_view(), name='review-create'),
@@ -58,4 +67,7 @@ urlpatterns = [
 
     # Модерация отзыва (одобрение/отклонение)
     path('reviews/moderation/<int:pk>/', ReviewModerationUpdateView.as_view(), name='review-moderation-update'),
+
+    # Массовая модерация отзывов (одобрение/отклонение выбранных)
+    path('reviews/moderation/bulk/', ReviewBulkModerationView.as_view(), name='review-moderation-bulk'),
 ]
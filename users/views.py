@@ -12,13 +12,14 @@ from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate, update_session_auth_hash
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from django.conf import settings
 from django.urls import reverse_lazy
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.http import Http404
 
 from .forms import (
     CustomUserCreationForm,
@@ -26,8 +27,12 @@ from .forms import (
     CustomUserUpdateForm,
     ReviewForm,
 )
-from .models import Review, CustomUser
+from .models import Review, CustomUser, OutgoingEmail
 from .utils import generate_random_password
+from .async_utils import AsyncViewMixin
+from .authorization import can_moderate_reviews
+from .services import MODERATION_STATUSES, moderate_reviews
+from dogs.pagination import KeysetPaginator, InvalidCursor
 
 
 # Домашняя страница
@@ -52,13 +57,12 @@ class UserCreateView(CreateView):
             'emails/temp_password_email.html', {'temp_password': temp_password}
         )
         plain_message = strip_tags(html_message)
-        send_mail(
+        OutgoingEmail.enqueue(
             subject,
             plain_message,
-            settings.DEFAULT_FROM_EMAIL,
             [user.email],
             html_message=html_message,
-            fail_silently=False,
+            sensitive=True,
         )
 
         messages.success(
@@ -115,6 +119,12 @@ class ProfileView(LoginRequiredMixin, TemplateView):
         return get_object_or_404(CustomUser, slug=slug)
 
 
+# Профиль пользователя (асинхронный вариант для ASGI)
+class AsyncProfileView(AsyncViewMixin, ProfileView):
+    async def get(self, request, *args, **kwargs):
+        return await self.run_and_render(TemplateView.get, self, request, *args, **kwargs)
+
+
 # Обновление данных профиля
 class UpdateProfileView(LoginRequiredMixin, FormView):
     """
@@ -209,13 +219,12 @@ class GenerateTempPasswordView(View):
             'emails/temp_password_email.html', {'temp_password': temp_password}
         )
         plain_message = strip_tags(html_message)
-        send_mail(
+        OutgoingEmail.enqueue(
             subject,
             plain_message,
-            settings.DEFAULT_FROM_EMAIL,
             [user.email],
             html_message=html_message,
-            fail_silently=False,
+            sensitive=True,
         )
 
         messages.success(request, "Временный пароль отправлен на ваш email.")
@@ -240,8 +249,8 @@ class UserListView(LoginRequiredMixin, ListView):
     context_object_name = 'users'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        if not self.request.user.is_staff and not self.request.user.groups.filter(name='moderators').exists():
+        queryset = super().get_queryset().select_related('review_stats')
+        if not can_moderate_reviews(self.request.user):
             queryset = queryset.exclude(is_staff=True).exclude(groups__name='moderators')
         return queryset
 
@@ -251,13 +260,33 @@ class UserDetailView(DetailView):
     model = get_user_model()
     template_name = 'users/user_detail.html'
     context_object_name = 'target_user'
+    queryset = get_user_model().objects.select_related('review_stats')
 
     def get_context_data(self, **kwargs):
+        """
+        Одобренные отзывы о пользователе постранично, новые первыми
+        """
         context = super().get_context_data(**kwargs)
-        context['reviews'] = Review.objects.filter(target_user=self.object)
+        reviews = Review.objects.filter(
+            target_user=self.object, status='approved'
+        ).select_related('author').order_by('-created_at', '-pk')
+        paginator = Paginator(reviews, settings.REVIEW_PAGE_SIZE)
+        stats = getattr(self.object, 'review_stats', None)
+        if stats is not None:
+            # Количество одобренных отзывов уже известно из статистики: COUNT(*) не выполняется
+            paginator.count = max(stats.review_count, 0)
+        page = paginator.get_page(self.request.GET.get('page'))
+        context['reviews'] = page
+        context['page_obj'] = page
         return context
 
 
+# Подробный просмотр пользователя (асинхронный вариант для ASGI)
+class AsyncUserDetailView(AsyncViewMixin, UserDetailView):
+    async def get(self, request, *args, **kwargs):
+        return await self.run_and_render(DetailView.get, self, request, *args, **kwargs)
+
+
 # Создание отзыва
 class ReviewCreateView(LoginRequiredMixin, CreateView):
     model = Review
@@ -292,12 +321,24 @@ class ReviewModerationListView(LoginRequiredMixin, UserPassesTestMixin, ListView
     model = Review
     template_name = 'reviews/moderation_list.html'
     context_object_name = 'reviews'
+    paginate_by = settings.REVIEW_PAGE_SIZE
 
     def test_func(self):
-        return self.request.user.is_staff or self.request.user.groups.filter(name='moderators').exists()
+        return can_moderate_reviews(self.request.user)
 
     def get_queryset(self):
-        return Review.objects.filter(status='pending')
+        return Review.objects.filter(status='pending').select_related('author', 'target_user')
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Курсорная пагинация очереди: старые отзывы первыми, без OFFSET и COUNT(*)
+        """
+        paginator = KeysetPaginator(queryset, 'created_at', page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Неверный курсор пагинации.")
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
 class ReviewModerationUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
@@ -307,14 +348,37 @@ class ReviewModerationUpdateView(LoginRequiredMixin, UserPassesTestMixin, Update
     success_url = reverse_lazy('review-moderation-list')
 
     def test_func(self):
-        return self.request.user.is_staff or self.request.user.groups.filter(name='moderators').exists()
+        return can_moderate_reviews(self.request.user)
 
     def form_valid(self, form):
         review = form.save(commit=False)
+        # approve() и reject() сами сохраняют отзыв, повторное сохранение формой не нужно
         if review.status == 'approved':
             review.approve()
             messages.success(self.request, f"Отзыв пользователя {review.author.username} одобрен.")
         elif review.status == 'rejected':
             review.reject()
             messages.info(self.request, f"Отзыв пользователя {review.author.username} отклонён.")
-        return super().form_valid(form)
+        else:
+            return super().form_valid(form)
+        return redirect(self.get_success_url())
+
+
+# Массовая модерация отзывов (выбранные в очереди отзывы одобряются или отклоняются одним запросом)
+class ReviewBulkModerationView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return can_moderate_reviews(self.request.user)
+
+    def post(self, request):
+        status = request.POST.get('status')
+        review_ids = [int(pk) for pk in request.POST.getlist('review_ids') if pk.isdigit()]
+        if status not in MODERATION_STATUSES or not review_ids:
+            messages.error(request, "Выберите отзывы и действие.")
+            return redirect('review-moderation-list')
+
+        count = moderate_reviews(review_ids, status)
+        if status == 'approved':
+            messages.success(request, f"Одобрено отзывов: {count}.")
+        else:
+            messages.info(request, f"Отклонено отзывов: {count}.")
+        return redirect('review-moderation-list')